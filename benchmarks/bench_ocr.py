@@ -0,0 +1,232 @@
+"""
+Benchmark de ponta a ponta do extrair_texto_ocr, com o tempo de cada etapa.
+
+Renderiza cupons de referência (os mesmos do bench_parser) em PDF, nas variantes
+com camada de texto e só imagem, e roda cada modo de OCR configurado. Para cada
+combinação mostra o tempo por etapa (rasterização, pré-processamento,
+reconhecimento, OCRmyPDF, extração do texto), o pico de memória (RSS) e a taxa
+de erro de caracteres (CER) em relação ao texto original.
+
+Cada combinação roda num processo novo, então o pico de RSS é só dela. Precisa
+do Tesseract e do OCRmyPDF instalados; combinações que falharem aparecem com o erro.
+
+    python benchmarks/bench_ocr.py --json antes.json
+    python benchmarks/bench_ocr.py --modos direto --comparar antes.json
+"""
+import argparse
+import json
+import random
+import resource
+import statistics
+import subprocess
+import sys
+import textwrap
+import time
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+from typing import Dict, List, Optional, Tuple
+
+from bench_parser import RAIZ, achatar_metricas, gerar_cupom
+
+VARIANTES = ("texto", "imagem")
+# Largura da bobina de 80 mm e colunas que cabem nela em Courier 8
+LARGURA_CUPOM_PT = 226
+COLUNAS_CUPOM = 42
+
+
+def quebrar_linhas(texto: str) -> str:
+    """Quebra as linhas longas como a impressora térmica faz; esse é o texto de referência."""
+    return "\n".join(
+        parte
+        for linha in texto.replace("\f", "\n").splitlines()
+        for parte in (textwrap.wrap(linha, COLUNAS_CUPOM) or [""])
+    )
+
+
+def renderizar_cupom(texto: str, variante: str, dpi: int) -> bytes:
+    """PDF do cupom; a variante "imagem" tem só a página rasterizada, como um cupom escaneado."""
+    import fitz
+
+    linhas = quebrar_linhas(texto).splitlines()
+    altura = 20 + 11 * len(linhas)
+    with fitz.open() as doc:
+        pagina = doc.new_page(width=LARGURA_CUPOM_PT, height=altura)
+        for indice, linha in enumerate(linhas):
+            pagina.insert_text((8, 18 + 11 * indice), linha, fontname="cour", fontsize=8)
+        if variante == "texto":
+            return doc.tobytes()
+        pixmap = pagina.get_pixmap(dpi=dpi, colorspace=fitz.csGRAY)
+        with fitz.open() as escaneado:
+            nova = escaneado.new_page(width=pagina.rect.width, height=pagina.rect.height)
+            nova.insert_image(nova.rect, stream=pixmap.tobytes("png"))
+            return escaneado.tobytes()
+
+
+def _normalizar(texto: str) -> str:
+    return " ".join(texto.upper().split())
+
+
+def taxa_erro_caracteres(referencia: str, reconhecido: str) -> float:
+    """Distância de Levenshtein entre os textos normalizados dividida pelo tamanho da referência."""
+    a, b = _normalizar(referencia), _normalizar(reconhecido)
+    if not a:
+        return 0.0 if not b else 1.0
+    anterior = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        atual = [i]
+        for j, cb in enumerate(b, 1):
+            atual.append(min(anterior[j] + 1, atual[j - 1] + 1, anterior[j - 1] + (ca != cb)))
+        anterior = atual
+    return anterior[-1] / len(a)
+
+
+def _rodar_combinacao(documentos: List[Tuple[str, bytes]], modo: str, preprocessamento: str, repeticoes: int) -> Dict:
+    """Executado num processo novo; devolve tempos, etapas, CER e pico de RSS."""
+    try:
+        return _medir_combinacao(documentos, modo, preprocessamento, repeticoes)
+    except Exception as e:
+        # Algumas exceções (ex.: do pytesseract) não voltam inteiras pelo pickle
+        return {"erro": f"{type(e).__name__}: {e}"}
+
+
+def _medir_combinacao(documentos: List[Tuple[str, bytes]], modo: str, preprocessamento: str, repeticoes: int) -> Dict:
+    from utils.ocr import extrair_texto_ocr, medir_etapas
+
+    # ru_maxrss vem em KB no Linux e não zera; os imports já disparam subprocessos,
+    # então o pico dos filhos só diz algo quando passa desse valor
+    filhos_import = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    nativo = modo == "nativo"
+    tempos: List[float] = []
+    etapas: Dict[str, float] = {}
+    erros_caracteres: List[float] = []
+    for rodada in range(repeticoes):
+        for referencia, pdf in documentos:
+            with medir_etapas() as etapas_documento:
+                inicio = time.perf_counter()
+                texto = extrair_texto_ocr(
+                    pdf,
+                    modo="texto" if nativo else modo,
+                    usar_texto_nativo=nativo,
+                    preprocessamento=preprocessamento,
+                )
+                tempos.append(time.perf_counter() - inicio)
+            for etapa, segundos in etapas_documento.items():
+                etapas[etapa] = etapas.get(etapa, 0.0) + segundos
+            if not rodada:
+                erros_caracteres.append(taxa_erro_caracteres(referencia, texto))
+
+    # Os filhos incluem o Tesseract chamado pelo OCRmyPDF
+    proprio = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    filhos = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return {
+        "media_ms": round(statistics.mean(tempos) * 1000, 1),
+        "p50_ms": round(statistics.median(tempos) * 1000, 1),
+        "max_ms": round(max(tempos) * 1000, 1),
+        "etapas_ms": {etapa: round(segundos / len(tempos) * 1000, 1) for etapa, segundos in sorted(etapas.items())},
+        "cer": round(statistics.mean(erros_caracteres), 4),
+        "pico_rss_mb": round(proprio / 1024, 1),
+        "pico_rss_filhos_mb": round(filhos / 1024, 1),
+        "pico_rss_filhos_import_mb": round(filhos_import / 1024, 1),
+    }
+
+
+def executar(cupons: int, semente: int, modos: List[str], variantes: List[str],
+             preprocessamentos: List[str], dpi: int, repeticoes: int) -> Dict:
+    rng = random.Random(semente)
+    textos = [quebrar_linhas(gerar_cupom(rng, 0.0)[0]) for _ in range(cupons)]
+    documentos = {variante: [(texto, renderizar_cupom(texto, variante, dpi)) for texto in textos] for variante in variantes}
+
+    combinacoes: Dict[str, Dict] = {}
+    contexto = multiprocessing.get_context("spawn")
+    for variante in variantes:
+        # Texto nativo só faz sentido no PDF com camada de texto
+        for modo in (["nativo"] if variante == "texto" else []) + modos:
+            for preprocessamento in (["nenhum"] if modo == "nativo" else preprocessamentos):
+                nome = f"{variante}/{modo}/{preprocessamento}"
+                print(f"rodando {nome}...", file=sys.stderr)
+                with ProcessPoolExecutor(max_workers=1, mp_context=contexto) as executor:
+                    try:
+                        combinacoes[nome] = executor.submit(
+                            _rodar_combinacao, documentos[variante], modo, preprocessamento, repeticoes
+                        ).result()
+                    except Exception as e:
+                        combinacoes[nome] = {"erro": f"{type(e).__name__}: {e}"}
+
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=RAIZ, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except Exception:
+        commit = None
+    versoes = {}
+    for pacote in ("ocrmypdf", "pymupdf", "pytesseract", "tesserocr"):
+        try:
+            from importlib.metadata import version
+            versoes[pacote] = version(pacote)
+        except Exception:
+            versoes[pacote] = None
+    try:
+        versoes["tesseract"] = subprocess.run(
+            ["tesseract", "--version"], capture_output=True, text=True
+        ).stdout.splitlines()[0]
+    except Exception:
+        versoes["tesseract"] = None
+
+    return {
+        "commit": commit,
+        "versoes": versoes,
+        "parametros": {"cupons": cupons, "semente": semente, "dpi": dpi, "repeticoes": repeticoes},
+        "combinacoes": combinacoes,
+    }
+
+
+def imprimir(resultado: Dict, anterior: Optional[Dict] = None) -> None:
+    print(f"commit {resultado['commit']}  {resultado['parametros']}")
+    print(f"versões {resultado['versoes']}")
+    antigos = achatar_metricas(anterior.get("combinacoes", {})) if anterior else {}
+    if anterior:
+        print(f"comparando com commit {anterior.get('commit')}  {anterior.get('versoes')}")
+    for nome, metricas in resultado["combinacoes"].items():
+        print(nome)
+        if "erro" in metricas:
+            print(f"  erro: {metricas['erro']}")
+            continue
+        for metrica, valor in achatar_metricas(metricas).items():
+            linha = f"  {metrica:<32} {valor:>10}"
+            chave = f"{nome}.{metrica}"
+            if chave in antigos:
+                delta = valor - antigos[chave]
+                percentual = f" ({delta / antigos[chave]:+.1%})" if antigos[chave] else ""
+                linha += f"  {delta:+.4f}{percentual}"
+            print(linha)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cupons", type=int, default=5)
+    parser.add_argument("--semente", type=int, default=42)
+    parser.add_argument("--modos", default="texto,pdf,direto", help="modos do extrair_texto_ocr, separados por vírgula")
+    parser.add_argument("--variantes", default=",".join(VARIANTES))
+    parser.add_argument("--preprocessamentos", default="numpy,nenhum")
+    parser.add_argument("--dpi", type=int, default=200, help="resolução da variante só imagem")
+    parser.add_argument("--repeticoes", type=int, default=1)
+    parser.add_argument("--json", help="salva o resultado neste arquivo")
+    parser.add_argument("--comparar", help="resultado salvo de outro commit para mostrar as diferenças")
+    args = parser.parse_args()
+
+    resultado = executar(
+        args.cupons, args.semente, args.modos.split(","), args.variantes.split(","),
+        args.preprocessamentos.split(","), args.dpi, args.repeticoes,
+    )
+    anterior = None
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as arquivo:
+            anterior = json.load(arquivo)
+    imprimir(resultado, anterior)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as arquivo:
+            json.dump(resultado, arquivo, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
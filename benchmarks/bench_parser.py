@@ -0,0 +1,335 @@
+"""
+Benchmark do parse_campos / parse_items com cupons sintéticos.
+
+Gera um corpus reprodutível (quantidade de itens, ruído de OCR, quebra de página
+e campos faltando variam por cupom), mede cupons/s e p50/p99 por cupom e compara
+cada campo com o gabarito. Roda offline: sem Tesseract e sem Supabase.
+
+    python benchmarks/bench_parser.py --cupons 2000 --json antes.json
+    python benchmarks/bench_parser.py --cupons 2000 --comparar antes.json
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import time
+from typing import Dict, List, Optional, Tuple
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+# O cliente do Supabase é criado no import do load_files, mas nunca é usado aqui
+os.environ.setdefault("SUPABASE_URL", "http://localhost")
+os.environ.setdefault("SUPABASE_KEY", "eyJhbGciOiJIUzI1NiJ9.e30.offline")
+os.environ["ITENS_CATALOGO_SUPABASE"] = "0"
+
+RUAS = [
+    "RUA FLÁVIO JOSÉ MARCHIORI", "RUA SÃO PAULO", "AVENIDA BELÉM", "RUA JOÃO BATISTA DE OLIVEIRA",
+    "RUA CAPITÃO JOSÉ ANTÔNIO", "AVENIDA DOUTOR NOGUEIRA", "RUA SANTA CATARINA", "RUA DAS PALMEIRAS",
+    "RUA PEDRO DE TOLEDO", "RUA MARECHAL DEODORO", "AVENIDA ANTÔNIO CARLOS", "RUA SETE DE SETEMBRO",
+]
+BAIRROS = ["SANTO ANTONIO", "CENTRO", "JARDIM BOTÂNICO", "VILA REIS", "PARQUE DAS NAÇÕES", "JARDIM EUROPA"]
+SABORES = [
+    "CALABRESA", "CALABRESA CATUPIRY", "PORTUGUESA", "MUSSARELA", "QUATRO QUEIJOS", "FRANGO CATUPIRY",
+    "MARGUERITA", "ATUM", "BACON", "NAPOLITANA", "BAIANA", "ROMEU E JULIETA", "CHOCOLATE COM MORANGO",
+]
+BORDAS = ["CHOCOLATE", "CATUPIRY", "CHEDDAR", "CREAM CHEESE"]
+BEBIDAS = ["GUARANA ANTARCTICA 2L", "COCA COLA 2L", "SUCO DE LARANJA", "AGUA MINERAL"]
+CLIENTES = ["DAVID", "MARIA SOUZA", "JOSÉ CARLOS", "ANA PAULA LIMA", "PEDRO HENRIQUE", "LUCIANA"]
+PAGAMENTOS = ["CARTÃO DE DÉBITO", "CARTÃO DE CRÉDITO", "PIX", "DINHEIRO"]
+PIZZAS = ["PIZZA GRANDE", "PIZZA GIGANTE", "PIZZA MÉDIA", "PIZZA PEQUENA"]
+
+# Trocas típicas do Tesseract em cupom térmico
+CONFUSOES_OCR = {
+    "O": "0", "0": "O", "I": "1", "1": "I", "S": "5", "5": "S", "B": "8", "8": "B",
+    "E": "F", "L": "I", "A": "4", "Z": "2", "G": "6",
+}
+SEM_ACENTO = str.maketrans("ÁÀÂÃÉÊÍÓÔÕÚÇ", "AAAAEEIOOOUC")
+
+CAMPOS = (
+    "tipo_venda", "senha", "data_hora", "cliente", "telefone", "novo_cliente", "rua", "numero",
+    "bairro", "itens_quantidade", "itens", "total_itens", "taxa_entrega", "valor_total",
+    "forma_pagamento", "tempo_entrega", "observacoes",
+)
+
+
+def _valor(centavos: int) -> str:
+    return f"{centavos // 100},{centavos % 100:02d}"
+
+
+def _aplicar_ruido(linha: str, taxa: float, rng: random.Random) -> str:
+    if not taxa:
+        return linha
+    saida = []
+    for letra in linha:
+        sorteio = rng.random()
+        if sorteio < taxa and letra in CONFUSOES_OCR:
+            letra = CONFUSOES_OCR[letra]
+        elif sorteio < taxa * 3:
+            letra = letra.translate(SEM_ACENTO)
+        saida.append(letra)
+    return "".join(saida)
+
+
+def gerar_cupom(rng: random.Random, ruido: float) -> Tuple[str, Dict]:
+    """Texto de um cupom no layout do PDV e o gabarito do que o parser deveria extrair."""
+    tipo = rng.choice(["ENTREGA", "ENTREGA", "ENTREGA", "RETIRAR", "BALCAO"])
+    senha = str(rng.randint(1, 999)) if rng.random() < 0.7 else None
+    data = f"{rng.randint(1, 28):02d}/{rng.randint(1, 12):02d}/2025"
+    hora = f"{rng.randint(10, 23):02d}:{rng.randint(0, 59):02d}:{rng.randint(0, 59):02d}"
+    telefone = f"169{rng.randint(10000000, 99999999)}"
+    faltando = {campo for campo in ("cliente", "origem", "atendente", "taxa_entrega", "tempo_entrega", "observacoes", "valor_total") if rng.random() < 0.1}
+
+    gabarito: Dict = {campo: None for campo in CAMPOS}
+    gabarito.update(
+        tipo_venda=tipo.capitalize(), senha=senha, data_hora=f"{data} {hora}",
+        telefone=telefone, novo_cliente=rng.random() < 0.3,
+    )
+    linhas = ["LA PASTA", "(16) 9-9288-3809", f"{tipo} {senha}" if senha else tipo, f"{data} ÀS {hora}"]
+    if "origem" not in faltando:
+        linhas.append("ORIGEM: LOCAL")
+    if "atendente" not in faltando:
+        linhas.append("ATENDENTE: CAIXA")
+    if "cliente" not in faltando:
+        gabarito["cliente"] = rng.choice(CLIENTES)
+        linhas.append(f"CLIENTE: {gabarito['cliente']}")
+    linhas.append(f"TEL: ({telefone[:2]}) {telefone[2]}-{telefone[3:7]}-{telefone[7:]}")
+    if tipo == "ENTREGA":
+        gabarito.update(rua=rng.choice(RUAS), numero=str(rng.randint(1, 2500)), bairro=rng.choice(BAIRROS))
+        linhas.append(f"ENDEREÇO: {gabarito['rua']}, {gabarito['numero']}, {gabarito['bairro']}, JARDINÓPOLIS/SP")
+    if gabarito["novo_cliente"]:
+        linhas.append("** NOVO CLIENTE **")
+
+    itens: List[Tuple] = []
+    total = 0
+    paginas = rng.random() < 0.2
+    quantidade_itens = rng.randint(1, 8)
+    for indice in range(quantidade_itens):
+        if paginas and indice == quantidade_itens // 2:
+            linhas += ["\f", "PÁGINA 1/2"]
+        preco = rng.randint(1500, 9000)
+        total += preco
+        if rng.random() < 0.75:
+            descricao = rng.choice(PIZZAS)
+            sabores = rng.sample(SABORES, rng.choice([1, 2]))
+            borda = rng.choice(BORDAS) if rng.random() < 0.3 else None
+            linhas.append(f"01 {descricao} {_valor(preco)}")
+            fracao = "1/2 - " if len(sabores) == 2 else ""
+            linhas += [f"{fracao}{sabor}" for sabor in sabores]
+            if borda:
+                linhas += ["BORDA:", f">> {borda}"]
+        else:
+            descricao, sabores, borda = "REFRIGERANTE", [rng.choice(BEBIDAS)], None
+            linhas += [f"01 {descricao} {_valor(preco)}", sabores[0]]
+        itens.append(("01", descricao, tuple(sabores), borda))
+    gabarito["itens"] = itens
+    gabarito["itens_quantidade"] = len(itens)
+
+    gabarito["total_itens"] = _valor(total)
+    linhas.append(f"TOTAL ITENS: {_valor(total)}")
+    taxa = rng.randint(300, 1000) if tipo == "ENTREGA" else 0
+    if taxa and "taxa_entrega" not in faltando:
+        gabarito["taxa_entrega"] = _valor(taxa)
+        linhas.append(f"TAXA DE ENTREGA: + {_valor(taxa)}")
+    # Mesmo sem a linha do valor do pedido o gabarito é o total real
+    gabarito["valor_total"] = _valor(total + taxa)
+    if "valor_total" not in faltando:
+        linhas.append(f"VALOR DO PEDIDO: R$ {_valor(total + taxa)}")
+    gabarito["forma_pagamento"] = rng.choice(PAGAMENTOS)
+    linhas.append(f"FORMA DE PAGAMENTO: {gabarito['forma_pagamento']}")
+    if "tempo_entrega" not in faltando:
+        minutos = rng.choice([20, 30, 40, 50])
+        gabarito["tempo_entrega"] = f"{minutos} min | {hora}"
+        linhas.append(f"TEMPO P/ ENTREGA: {minutos} MIN | {hora}")
+    if "observacoes" not in faltando and rng.random() < 0.4:
+        gabarito["observacoes"] = "TOCAR A CAMPAINHA"
+        linhas.append(f"OBSERVAÇÕES: {gabarito['observacoes']}")
+
+    return "\n".join(_aplicar_ruido(linha, ruido, rng) for linha in linhas), gabarito
+
+
+def gerar_corpus(quantidade: int, semente: int) -> List[Tuple[str, Dict, float]]:
+    rng = random.Random(semente)
+    corpus = []
+    for _ in range(quantidade):
+        ruido = rng.choice([0.0, 0.0, 0.01, 0.03])
+        texto, gabarito = gerar_cupom(rng, ruido)
+        corpus.append((texto, gabarito, ruido))
+    return corpus
+
+
+def _texto(valor) -> Optional[str]:
+    from utils.correcao_ocr import normalizar_termo
+
+    return None if valor is None else normalizar_termo(str(valor))
+
+
+def extrair_obtido(resultado: Dict) -> Dict:
+    endereco = resultado.get("endereco")
+    data_hora = resultado.get("data_hora")
+    itens = [
+        (item["quantidade"], item["descricao"], tuple(item["sabores"]), item["borda"])
+        for item in resultado.get("items") or []
+    ]
+    return {
+        "tipo_venda": resultado.get("tipo_venda"),
+        "senha": resultado.get("senha"),
+        "data_hora": data_hora.strftime("%d/%m/%Y %H:%M:%S") if data_hora else None,
+        "cliente": resultado.get("cliente"),
+        "telefone": resultado.get("telefone"),
+        "novo_cliente": resultado.get("novo_cliente"),
+        "rua": endereco.rua if endereco else None,
+        "numero": endereco.numero if endereco else None,
+        "bairro": endereco.bairro if endereco else None,
+        "itens_quantidade": len(itens),
+        "itens": itens,
+        "total_itens": resultado.get("total_itens"),
+        "taxa_entrega": resultado.get("taxa_entrega"),
+        "valor_total": resultado.get("valor_total"),
+        "forma_pagamento": resultado.get("forma_pagamento"),
+        "tempo_entrega": resultado.get("tempo_entrega"),
+        "observacoes": resultado.get("observacoes"),
+    }
+
+
+def campo_correto(campo: str, esperado, obtido) -> bool:
+    if campo == "forma_pagamento" and esperado is None:
+        return obtido == "Não Especificado"
+    if campo == "itens":
+        return len(esperado) == len(obtido) and all(
+            _texto(e[0]) == _texto(o[0]) and _texto(e[1]) == _texto(o[1])
+            and [_texto(s) for s in e[2]] == [_texto(s) for s in o[2]] and _texto(e[3]) == _texto(o[3])
+            for e, o in zip(esperado, obtido)
+        )
+    if isinstance(esperado, (bool, int)) or esperado is None:
+        return esperado == obtido
+    return _texto(esperado) == _texto(obtido)
+
+
+def _percentil(tempos: List[float], percentil: float) -> float:
+    ordenados = sorted(tempos)
+    return ordenados[min(len(ordenados) - 1, int(len(ordenados) * percentil))]
+
+
+def _resumo_tempos(tempos: List[float]) -> Dict:
+    total = sum(tempos)
+    return {
+        "cupons_por_segundo": round(len(tempos) / total, 1) if total else None,
+        "media_ms": round(statistics.mean(tempos) * 1000, 4),
+        "p50_ms": round(_percentil(tempos, 0.50) * 1000, 4),
+        "p99_ms": round(_percentil(tempos, 0.99) * 1000, 4),
+    }
+
+
+def executar(quantidade: int, semente: int, repeticoes: int, correcao: bool) -> Dict:
+    if not correcao:
+        os.environ["CORRECAO_OCR"] = "0"
+    from parse_items import parse_items
+    from parse_pedido import parse_campos
+    from utils import correcao_ocr
+
+    if correcao:
+        correcao_ocr.CORRECAO_OCR = True
+        correcao_ocr.definir_indices(SABORES + BEBIDAS, RUAS, BAIRROS)
+
+    corpus = gerar_corpus(quantidade, semente)
+    tempos_campos: List[float] = []
+    tempos_itens: List[float] = []
+    acertos = {campo: 0 for campo in CAMPOS}
+    acertos_por_ruido: Dict[float, List[int]] = {}
+
+    for rodada in range(repeticoes):
+        for texto, gabarito, ruido in corpus:
+            inicio = time.perf_counter()
+            resultado = parse_campos(texto)
+            if correcao:
+                # Como no pipeline para texto de OCR
+                resultado = correcao_ocr.corrigir_campos(resultado)
+            tempos_campos.append(time.perf_counter() - inicio)
+
+            linhas = [linha.strip() for linha in texto.upper().splitlines() if linha.strip()]
+            inicio = time.perf_counter()
+            parse_items(linhas)
+            tempos_itens.append(time.perf_counter() - inicio)
+
+            if rodada:
+                continue
+            obtido = extrair_obtido(resultado)
+            corretos = 0
+            for campo in CAMPOS:
+                if campo_correto(campo, gabarito[campo], obtido[campo]):
+                    acertos[campo] += 1
+                    corretos += 1
+            acertos_por_ruido.setdefault(ruido, []).append(corretos)
+
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=RAIZ, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except Exception:
+        commit = None
+
+    return {
+        "commit": commit,
+        "parametros": {"cupons": quantidade, "semente": semente, "repeticoes": repeticoes, "correcao": correcao},
+        "desempenho": {"parse_campos": _resumo_tempos(tempos_campos), "parse_items": _resumo_tempos(tempos_itens)},
+        "acuracia": {campo: round(acertos[campo] / quantidade, 4) for campo in CAMPOS},
+        "acuracia_por_ruido": {
+            str(ruido): round(statistics.mean(corretos) / len(CAMPOS), 4)
+            for ruido, corretos in sorted(acertos_por_ruido.items())
+        },
+    }
+
+
+def achatar_metricas(dados: Dict, prefixo: str = "") -> Dict[str, float]:
+    planos = {}
+    for chave, valor in dados.items():
+        nome = f"{prefixo}{chave}"
+        if isinstance(valor, dict):
+            planos.update(achatar_metricas(valor, nome + "."))
+        elif isinstance(valor, (int, float)) and not isinstance(valor, bool):
+            planos[nome] = valor
+    return planos
+
+
+def imprimir(resultado: Dict, anterior: Optional[Dict] = None) -> None:
+    atuais = achatar_metricas({k: resultado[k] for k in ("desempenho", "acuracia", "acuracia_por_ruido")})
+    antigos = achatar_metricas({k: anterior.get(k, {}) for k in ("desempenho", "acuracia", "acuracia_por_ruido")}) if anterior else {}
+    print(f"commit {resultado['commit']}  {resultado['parametros']}")
+    if anterior:
+        print(f"comparando com commit {anterior.get('commit')}  {anterior.get('parametros')}")
+    for nome, valor in atuais.items():
+        linha = f"  {nome:<40} {valor:>12}"
+        if nome in antigos:
+            delta = valor - antigos[nome]
+            percentual = f" ({delta / antigos[nome]:+.1%})" if antigos[nome] else ""
+            linha += f"  {delta:+.4f}{percentual}"
+        print(linha)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cupons", type=int, default=2000)
+    parser.add_argument("--semente", type=int, default=42)
+    parser.add_argument("--repeticoes", type=int, default=3, help="passadas de tempo sobre o corpus")
+    parser.add_argument("--correcao", action="store_true", help="liga a correção do OCR com o vocabulário do corpus")
+    parser.add_argument("--json", help="salva o resultado neste arquivo")
+    parser.add_argument("--comparar", help="resultado salvo de outro commit para mostrar as diferenças")
+    args = parser.parse_args()
+
+    resultado = executar(args.cupons, args.semente, args.repeticoes, args.correcao)
+    anterior = None
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as arquivo:
+            anterior = json.load(arquivo)
+    imprimir(resultado, anterior)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as arquivo:
+            json.dump(resultado, arquivo, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,18 @@
+import os
+
 from celery import Celery
+from celery.signals import task_postrun, task_prerun
+
+from utils.logs import entrar_contexto, sair_contexto
+
+REDIS_URL = os.getenv("REDIS_URL", "redis://redis:6379/0")
 
 # Configuração do Celery com Redis como broker
 app = Celery(
     "worker",
-    broker="redis://redis:6379/0",  # URL do Redis
-    backend="redis://redis:6379/0"  # Backend para armazenar resultados
+    broker=REDIS_URL,  # URL do Redis
+    backend=REDIS_URL,  # Backend para armazenar resultados
+    include=["tasks.fila_celery", "tasks.fila_ocr"],
 )
 
 app.conf.update(
@@ -13,6 +21,28 @@ app.conf.update(
     result_serializer="json",
     timezone="America/Sao_Paulo",
     enable_utc=True,
+    # OCR roda em workers próprios: celery -A celery_app worker -Q ocr
+    task_routes={"tasks.fila_ocr.*": {"queue": "ocr"}},
+    # Mantém o logger em fila do load_files em vez dos handlers do Celery
+    worker_hijack_root_logger=False,
 )
 
-app.autodiscover_tasks(['tasks', 'tasks.fila_celery.reatribuir_entregas_para_motoboy_ocioso'])
\ No newline at end of file
+_contextos_tarefas = {}
+
+
+@task_prerun.connect
+def iniciar_contexto_tarefa(task_id=None, task=None, **kwargs):
+    _contextos_tarefas[task_id] = entrar_contexto(task_id=task_id, tarefa=task.name if task else None)
+
+
+@task_postrun.connect
+def encerrar_contexto_tarefa(task_id=None, **kwargs):
+    token = _contextos_tarefas.pop(task_id, None)
+    if token is not None:
+        try:
+            sair_contexto(token)
+        except ValueError:
+            # Pools de threads podem terminar a tarefa em outro contexto
+            pass
+
+app.autodiscover_tasks(['tasks', 'tasks.fila_celery.reatribuir_entregas_para_motoboy_ocioso'])
@@ -1,4 +1,4 @@
-from load_files import supabase
+from load_files import logger, supabase
 
 def contar_pizzas_no_supabase(id_order: int | None = None):
     # 1. Buscar todos os itens válidos (com relation_id nulo) dos pedidos com status correto
@@ -18,7 +18,7 @@ def contar_pizzas_no_supabase(id_order: int | None = None):
     items_result = query.execute()
 
     if not items_result.data:
-        print("Nenhum item encontrado.")
+        logger.debug("Nenhum item encontrado para contar pizzas.")
         return 0
 
     # 2. Coletar todos os id_product usados
@@ -28,7 +28,7 @@ def contar_pizzas_no_supabase(id_order: int | None = None):
         qtd = item.get("qtd", 1)
         if id_prod:
             produtos_ativos[id_prod] = produtos_ativos.get(id_prod, 0) + qtd
-    print(f"Produtos ativos: {produtos_ativos}")
+    logger.debug("Produtos ativos: %d", len(produtos_ativos))
     if not produtos_ativos:
         return 0
 
@@ -44,5 +44,5 @@ def contar_pizzas_no_supabase(id_order: int | None = None):
             
     # 4. Somar as quantidades de pizzas
     total_pizzas = sum(produtos_ativos.values())
-    print(f"Total de pizzas: {total_pizzas}")
+    logger.debug("Total de pizzas: %d", total_pizzas)
     return total_pizzas
\ No newline at end of file
@@ -1,13 +1,11 @@
 import logging
 import os
 from supabase import create_client
+from utils.logs import configurar_logs
 
 
-logging.basicConfig(
-    filename="api_logs.txt",  # Nome do arquivo de log
-    level=logging.INFO,       # Nível de log
-    format="%(asctime)s - %(levelname)s - %(message)s"
-)
+# Arquivo api_logs.txt, gravado por uma thread a partir de uma fila (ver utils/logs.py)
+configurar_logs()
 logger = logging.getLogger(__name__)
 
 SUPABASE_URL = os.getenv("SUPABASE_URL")
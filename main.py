@@ -1,29 +1,40 @@
 import asyncio
-from io import BytesIO
+from contextlib import AsyncExitStack
 import json
 import os
+from pathlib import Path
 import threading
 import time
 from urllib.parse import quote_plus
 import uuid
-import ocrmypdf
+import zipfile
 import pandas as pd
-from fastapi import FastAPI, UploadFile, File, HTTPException, WebSocket
-from typing import Optional, Dict
+from fastapi import FastAPI, UploadFile, File, HTTPException, WebSocket, Query
+from typing import List, Dict, Tuple, Union
 from datetime import datetime, timezone
 
-from fastapi.responses import JSONResponse
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, StreamingResponse
+from starlette.background import BackgroundTask
 import websocket
 from tasks.fila_celery import reatribuir_entregas_para_motoboy_ocioso
-from parse_items import parse_items
-from pdf2image import convert_from_bytes
-import pytesseract
-import re
+from tasks.fila_ocr import analisar_pedido_ocr, guardar_pdf
+from parse_items import carregar_catalogo, invalidar_catalogo
+from pipeline_pedido import analisar_com_escalonamento, analisar_imagem
 import urllib
 from models import Endereco, RoterizacaoInput,  TempoEstimadoInput
 from dotenv import load_dotenv
 from datetime import datetime
-from utils.geo import get_coordenadas
+from utils.geo import cache_geo, get_coordenadas
+from utils.ocr import MODO_ADAPTATIVO, MODOS_OCR, TIPOS_IMAGEM, inicializar_trabalhador_ocr
+from utils.ocr_motores import idiomas_disponiveis
+from utils.ocr_preprocessamento import OCR_PREPROCESSAMENTO, PREPROCESSAMENTOS
+from utils.ocr_pool import FilaOCRCheia, PoolOCR, TempoOCREsgotado, esperando_vaga
+from utils.cache_recibos import CacheRecibos, chave_recibo
+from utils.correcao_ocr import carregar_indices
+from utils.geocoder_local import carregar_geocoder_local
+from utils.logs import amostrado, contexto_log
+from utils.uploads import UploadSalvo, extrair_pdfs_zip, salvar_upload
 from celery_app import app as celery_app
 from load_files import SUPABASE_KEY, SUPABASE_URL, supabase, logger
 from dotenv import load_dotenv
@@ -31,19 +42,19 @@ from dotenv import load_dotenv
 load_dotenv()
 
 app = FastAPI()
+pool_ocr = PoolOCR(inicializador=inicializar_trabalhador_ocr)
+cache_recibos = CacheRecibos()
 def verify_tesseract() -> bool:
     try:
-        langs = pytesseract.get_languages(config='')
+        langs = idiomas_disponiveis()
         if 'por' not in langs:
             raise RuntimeError("Portuguese language data not found")
         return True
     except Exception as e:
-        logger.error(f"Tesseract verification failed: {e}")
+        logger.error("Tesseract verification failed: %s", e)
         return False
 
 
-from tempfile import NamedTemporaryFile
-import fitz  # PyMuPDF
 
 import asyncio
 
@@ -69,8 +80,8 @@ def broadcast_to_clients(message):
 
 def on_message(ws, message):
     data = json.loads(message)
-    print(f"Mensagem recebida: {data}")
-    logger.info(f"Mensagem recebida: {data}")
+    # O registro do pedido traz dados do cliente; só o evento vai para o log
+    logger.debug("Mensagem recebida do Realtime: %s", data.get("event"), extra=amostrado())
     if data.get("event") == "postgres_changes":
         payload = data["payload"]
         # Corrigido para acessar o novo registro
@@ -85,10 +96,9 @@ def on_message(ws, message):
                 capacidade_maxima=4
             )
         else:
-            print(f"Status inválido recebido: {status}")
+            logger.debug("Status inválido recebido: %s (pedido %s)", status, order_id)
 
 def on_open(ws):
-    print("Conectado ao Realtime Supabase")
     logger.info("Conectado ao Realtime Supabase")
     ws.send(json.dumps({
         "event": "phx_join",
@@ -115,7 +125,7 @@ def start_realtime():
         logger.error("SUPABASE_KEY or SUPABASE_URL not set in environment variables.")
         return
     realtime_url = f"wss://{SUPABASE_URL.replace('https://', '')}/realtime/v1/websocket?apikey={SUPABASE_KEY}"
-    logger.info(f"Conectando ao websocket: {realtime_url}")
+    logger.info("Conectando ao websocket: %s", realtime_url)
     while True:
         try:
             ws = websocket.WebSocketApp(
@@ -125,7 +135,7 @@ def start_realtime():
             )
             ws.run_forever()
         except Exception as e:
-            logger.error(f"Erro no websocket: {e}")
+            logger.error("Erro no websocket: %s", e)
         # Aguarda 10 segundos antes de tentar reconectar
         time.sleep(10)
 # ... (restante dos imports e código)
@@ -136,244 +146,201 @@ last_routes_state = {}
 
 # Inicie o listener no startup do FastAPI
 
-def parse_endereco(texto: str) -> Optional[Endereco]:
-    padrao_endereco = re.compile(
-        r"ENDEREÇO:\s*([^,]+),\s*(\d+)(?:\s*\(([^)]+)\))?,\s*([^,]+),\s*([^/]+)/([A-Z]{2})",
-        flags=re.IGNORECASE
-    )
+def validar_opcoes_ocr(modo_ocr: str, preprocessamento: str):
+    if modo_ocr not in MODOS_OCR + (MODO_ADAPTATIVO,):
+        raise HTTPException(400, f"modo_ocr deve ser um de: {', '.join(MODOS_OCR + (MODO_ADAPTATIVO,))}")
+    if preprocessamento not in PREPROCESSAMENTOS:
+        raise HTTPException(400, f"preprocessamento deve ser um de: {', '.join(PREPROCESSAMENTOS)}")
 
-    match = padrao_endereco.search(texto)
-    if not match:
-        return None
-
-    rua = match.group(1).replace(",", "").strip()
-    numero = match.group(2).strip()
-    referencia = match.group(3).strip() if match.group(3) else None
-    bairro = match.group(4).strip()
-    cidade = match.group(5).strip()
-    estado = match.group(6).strip()
-
-    complemento = f"Referência: {referencia}" if referencia else None
-
-    return Endereco(
-        rua=rua,
-        numero=numero,
-        bairro=bairro,
-        cidade=cidade,
-        estado=estado,
-        complemento=complemento,
-        datetime=datetime.now(timezone.utc),
-    )
+def chave_conteudo(upload: UploadSalvo, content_type: str, modo_ocr: str, preprocessamento: str) -> str:
+    eh_imagem = content_type in TIPOS_IMAGEM
+    return chave_recibo(upload.sha256, "imagem" if eh_imagem else modo_ocr, preprocessamento)
+
+# Referências às limpezas pendentes, para não serem coletadas antes de terminar
+_limpezas_pendentes: set = set()
 
-def extrair_telefone(texto: str) -> str:
+def limpar_apos_cache(chaves: List[str], temporarios: AsyncExitStack) -> None:
     """
-    Extrai o segundo telefone brasileiro do texto com correção de erros comuns de OCR.
-    Ignora números que não seguem o padrão de telefone válido.
-    Se não encontrar um segundo número, retorna o primeiro.
-    Exemplo: (16) -0737-3515 → 16997373515
+    Apaga os temporários só quando as tarefas de cache dessas chaves terminarem:
+    elas continuam lendo o arquivo (e são compartilhadas com outras requisições)
+    mesmo depois que o cliente desconecta.
     """
-    print(f"Texto para extrair telefone: {texto}")
-    padrao_telefone = re.compile(
-        r"(?:(?:TEL|TELEFONE|WHATSAPP|CELULAR|FONE)\s*:\s*)?"
-        r"\(?(\d{2})\)?\s*[-]?(\d{1,2})?[-]?(\d{4,5})[-]?(\d{4})",
-        re.IGNORECASE
-    )
-
-    # Encontrar todos os números no texto
-    matches = padrao_telefone.findall(texto)
-    print(f"Números encontrados: {matches}")
-
-    if not matches:
-        return "Número não encontrado"
-
-    # Formatar os números encontrados
-    numeros = []
-    for match in matches:
-        ddd = match[0]
-        numero = (match[1] or "") + match[2] + match[3]
-        telefone = f"{ddd}{numero}"
-
-        # Verificar se o número tem 10 ou 11 dígitos (padrão de telefone brasileiro)
-        if len(telefone) in [10, 11]:
-            numeros.append(telefone)
-
-    # Retornar o segundo número válido, se existir, ou o primeiro
-    if len(numeros) > 1:
-        return numeros[len(numeros) - 1]
-    elif numeros:
-        return numeros[0]
-
-    return "Número não encontrado"
-  
-def extract_clean_payment(text: str) -> str:
-    pattern = r'(?i)(?:CART[\u00c3A]O\s*(?:DE\s*)?(?:D[\u00c9E]BITO|CRÉDITO)|PIX|DINHEIRO|PAGAR\s*NO\s*LOCAL)'
-    try:
-        match = re.search(pattern, text)
-        if match:
-            payment = match.group(0).title()
-            payment = (payment.replace("Cartao", "Cartão")
-                              .replace("Debito", "Débito")
-                              .replace("Credito", "Crédito"))
-            return payment
-    except Exception as e:
-        logger.error(f"Payment extraction error: {e}")
-
-    return "Não Especificado"
-  
-def parse_campos(texto: str) -> Dict:
-    texto = texto.upper()
-    resultado = {}
-
-    tipo_match = re.search(r"(ENTREGA|RETIRAR|BALCAO|MESA)\s*(\d{1,5})?", texto)
-    if tipo_match:
-        resultado["tipo_venda"] = tipo_match.group(1).capitalize()
-        if tipo_match.group(2):
-            resultado["senha"] = tipo_match.group(2)
-
-    data_match = re.search(r"(\d{2}/\d{2}/\d{4})\s*ÀS\s*(\d{2}:\d{2}:\d{2})", texto)
-    if data_match:
-        resultado["data_hora"] = datetime.strptime(
-            f"{data_match.group(1)} {data_match.group(2)}",
-            "%d/%m/%Y %H:%M:%S"
-        )
-
-    cliente_match = re.search(r"CLIENTE:\s*(.+?)(?:\n|$)", texto)
-    if cliente_match:
-        resultado["cliente"] = cliente_match.group(1).strip().title()
-
-    email_match = re.search(r"EMAIL:\s*([^\n]+)", texto)
-    if email_match:
-        resultado["email"] = email_match.group(1).strip()
-
-    resultado["telefone"] = extrair_telefone(texto)
-
-    resultado["novo_cliente"] = "NOVO CLIENTE" in texto
-
-    origem_match = re.search(r"ORIGEM:\s*(.+?)(?:\n|$)", texto)
-    if origem_match:
-        resultado["origem"] = origem_match.group(1).strip()
-
-    atendente_match = re.search(r"ATENDENTE:\s*(.+?)(?:\n|$)", texto)
-    if atendente_match:
-        resultado["atendente"] = atendente_match.group(1).strip()
-
-    resultado["endereco"] = parse_endereco(texto)
-
-    linhas = [linha.strip() for linha in texto.splitlines() if linha.strip()]
-    resultado["items"] = parse_items(linhas)
-
-    total_itens_match = re.search(r"TOTAL ITENS:\s*([\d.,]+)", texto)
-    if total_itens_match:
-        resultado["total_itens"] = total_itens_match.group(1)
-
-    taxa_match = re.search(r"TAXA DE ENTREGA:\s*\+?\s*([\d.,]+)", texto)
-    if taxa_match:
-        resultado["taxa_entrega"] = taxa_match.group(1)
-
-    valor_total_match = re.search(r"VALOR\s*DO\s*PEDIDO:\s*(R\$)?\s*([^\n]+)", texto)
-    
-    if valor_total_match:
-        resultado["valor_total"] = valor_total_match.group(2).strip()
-    else:
-        for linha in reversed(linhas):
-            if re.search(r"\d+,\d{2}", linha):
-                resultado["valor_total"] = re.search(r"(\d+,\d{2})", linha).group(1) # type: ignore
-                break
-
-    payment_match = re.search(r'(?:FORMA\s*DE\s*PAGAMENTO|PAGAMENTO)\s*:\s*([^\n]+)', texto)
-    if payment_match:
-        raw_payment = ' '.join(payment_match.group(1).split())
-        resultado["forma_pagamento"] = extract_clean_payment(raw_payment)
-    else:
-        resultado["forma_pagamento"] = "Não Especificado"
-
-    tempo_match = re.search(r"TEMPO P/ ENTREGA:\s*(\d+)\s*MIN\s*\|\s*(\d{2}:\d{2}:\d{2})", texto)
-    if tempo_match:
-        resultado["tempo_entrega"] = f"{tempo_match.group(1)} min | {tempo_match.group(2)}"
-
-    observacoes_match = re.search(r"OBSERVAÇÕES:\s*(.+?)(?:\n|$)", texto)
-    if observacoes_match:
-        resultado["observacoes"] = observacoes_match.group(1).strip()
-
-    return resultado
-
-
-import fitz  # PyMuPDF
+    async def limpar():
+        await cache_recibos.aguardar(chaves)
+        await temporarios.aclose()
+
+    tarefa = asyncio.create_task(limpar())
+    _limpezas_pendentes.add(tarefa)
+    tarefa.add_done_callback(_limpezas_pendentes.discard)
+
+async def analisar_conteudo(
+    upload: UploadSalvo, content_type: str, modo_ocr: str, preprocessamento: str
+) -> Union[Dict, List[Dict]]:
+    eh_imagem = content_type in TIPOS_IMAGEM
+
+    async def processar():
+        # Os processos de OCR abrem o arquivo pelo caminho; o conteúdo não passa pelo pipe
+        if eh_imagem:
+            data = await analisar_imagem(pool_ocr, upload.caminho, preprocessamento)
+        else:
+            data = await analisar_com_escalonamento(pool_ocr, upload.caminho, modo_ocr, preprocessamento)
+        if not data:
+            raise HTTPException(422, "No valid data extracted")
+        return jsonable_encoder(data)
 
-def extrair_texto_ocr(pdf_bytes: bytes) -> str:
+    chave = chave_conteudo(upload, content_type, modo_ocr, preprocessamento)
     try:
-        with NamedTemporaryFile(delete=False, suffix=".pdf") as temp_pdf:
-            temp_pdf.write(pdf_bytes)
-            temp_pdf_path = temp_pdf.name
-
-        with NamedTemporaryFile(delete=False, suffix=".pdf") as temp_output:
-            temp_output_path = temp_output.name
-
-        ocrmypdf.ocr(
-            input_file=temp_pdf_path,
-            output_file=temp_output_path,
-            language='por',
-            force_ocr=True,
-            rotate_pages=True,
-            deskew=True,
-            optimize=3,
-            skip_text=False,
-            clean=True,
-            clean_final=True
-        )
-
-        texto_final = ""
-        with fitz.open(temp_output_path) as doc:
-            for page in doc:
-                texto_final += page.get_text("text") # type: ignore
-
-        if not texto_final.strip():
-            print("[Fallback OCR] Extraindo diretamente com pytesseract...")
-
-            imagens = convert_from_bytes(pdf_bytes, dpi=400)
-            custom_config = r'--oem 3 --psm 6 -l por'
-            textos = [
-                pytesseract.image_to_string(img, config=custom_config)
-                for img in imagens
-            ]
-            texto_final = "\n".join(textos)
-
-        return texto_final
-
-    except Exception as e:
-        logger.error(f"Erro no OCR: {e}")
-        raise
-
+        with contexto_log(upload=upload.sha256[:12], etapa="ocr"):
+            return await cache_recibos.obter_ou_calcular(chave, processar)
+    except FilaOCRCheia as e:
+        raise HTTPException(503, str(e), headers={"Retry-After": str(e.retry_after)})
+    except TempoOCREsgotado:
+        raise HTTPException(408, "OCR processing timed out")
 
 @app.post("/analisar-pedido/")
-async def analisar_pdf(file: UploadFile = File(...)):
+async def analisar_pdf(
+    file: UploadFile = File(...),
+    modo_ocr: str = Query(MODO_ADAPTATIVO),
+    preprocessamento: str = Query(OCR_PREPROCESSAMENTO),
+):
     try:
-        if file.content_type != "application/pdf":
-            raise HTTPException(400, "Only PDF files are accepted")
-
-        contents = await file.read()
-        if not contents:
-            raise HTTPException(400, "Empty PDF file")
+        if file.content_type != "application/pdf" and file.content_type not in TIPOS_IMAGEM:
+            raise HTTPException(400, "Only PDF or image (JPEG, PNG, WebP) files are accepted")
+        validar_opcoes_ocr(modo_ocr, preprocessamento)
 
+        temporarios = AsyncExitStack()
+        chaves = []
         try:
-            text = await asyncio.wait_for(
-                asyncio.get_event_loop().run_in_executor(None, lambda: extrair_texto_ocr(contents)),
-                timeout=60.0  # Aumentado o tempo limite para 60 segundos
-            )
-        except asyncio.TimeoutError:
-            raise HTTPException(408, "OCR processing timed out")
-
-        data = parse_campos(text)
-        if not data:
-            raise HTTPException(422, "No valid data extracted")
-
-        return data
+            upload = await temporarios.enter_async_context(salvar_upload(file))
+            if not upload.tamanho:
+                raise HTTPException(400, "Empty file")
+            chaves.append(chave_conteudo(upload, file.content_type, modo_ocr, preprocessamento))
+            return await analisar_conteudo(upload, file.content_type, modo_ocr, preprocessamento)
+        finally:
+            limpar_apos_cache(chaves, temporarios)
 
     except HTTPException:
         raise
     except Exception as e:
         logger.exception("Failed to process PDF")
         raise HTTPException(500, f"Processing failed: {e}")
+
+@app.post("/analisar-pedido/async")
+async def analisar_pdf_async(
+    file: UploadFile = File(...),
+    modo_ocr: str = Query(MODO_ADAPTATIVO),
+    preprocessamento: str = Query(OCR_PREPROCESSAMENTO),
+):
+    """Enfileira o OCR na fila "ocr" do Celery e devolve o id do job."""
+    if file.content_type != "application/pdf":
+        raise HTTPException(400, "Only PDF files are accepted")
+    validar_opcoes_ocr(modo_ocr, preprocessamento)
+
+    async with salvar_upload(file, sufixo=".pdf") as upload:
+        if not upload.tamanho:
+            raise HTTPException(400, "Empty PDF file")
+        contents = await asyncio.to_thread(Path(upload.caminho).read_bytes)
+
+    chave_pdf = await asyncio.to_thread(guardar_pdf, contents)
+    task = analisar_pedido_ocr.delay(chave_pdf, modo_ocr, preprocessamento)
+    return {"task_id": task.id}
+
+@app.post("/analisar-pedidos/lote")
+async def analisar_pdfs_lote(
+    files: List[UploadFile] = File(...),
+    modo_ocr: str = Query(MODO_ADAPTATIVO),
+    preprocessamento: str = Query(OCR_PREPROCESSAMENTO),
+):
+    """
+    Recebe vários PDFs ou fotos (ou .zip com PDFs) e devolve um JSON por linha, na ordem
+    em que cada arquivo termina. Erros de um arquivo vêm na própria linha.
+    """
+    validar_opcoes_ocr(modo_ocr, preprocessamento)
+
+    # Os arquivos temporários precisam durar até o fim do streaming da resposta
+    temporarios = AsyncExitStack()
+    arquivos: List[Tuple[str, str, UploadSalvo]] = []
+    # Tipo errado, arquivo grande demais ou zip inválido viram linha de erro, sem derrubar o lote
+    recusados: List[Dict] = []
+    try:
+        for file in files:
+            nome = file.filename or "arquivo.pdf"
+            try:
+                eh_zip = file.content_type in ("application/zip", "application/x-zip-compressed") or nome.lower().endswith(".zip")
+                if not eh_zip and file.content_type != "application/pdf" and file.content_type not in TIPOS_IMAGEM:
+                    raise HTTPException(400, f"Apenas PDF, imagem ou zip são aceitos: {nome}")
+                upload = await temporarios.enter_async_context(salvar_upload(file))
+                if eh_zip:
+                    try:
+                        pdfs = temporarios.enter_context(extrair_pdfs_zip(upload.caminho))
+                    except zipfile.BadZipFile:
+                        raise HTTPException(400, f"Arquivo zip inválido: {nome}")
+                    arquivos.extend((nome_pdf, "application/pdf", pdf) for nome_pdf, pdf in pdfs)
+                else:
+                    arquivos.append((nome, file.content_type, upload))
+            except HTTPException as e:
+                recusados.append({"arquivo": nome, "status": e.status_code, "erro": e.detail})
+        if not arquivos and not recusados:
+            raise HTTPException(400, "Nenhum arquivo enviado")
+    except BaseException:
+        await temporarios.aclose()
+        raise
+
+    # Um arquivo por processo do pool; as páginas de cada um esperam vaga no pool
+    # em vez de estourar a fila de admissão e voltar como 503
+    limite = asyncio.Semaphore(pool_ocr.workers)
+    chaves = [chave_conteudo(upload, content_type, modo_ocr, preprocessamento) for _, content_type, upload in arquivos]
+
+    async def limpar_temporarios():
+        limpar_apos_cache(chaves, temporarios)
+
+    async def processar(nome: str, content_type: str, upload: UploadSalvo) -> Dict:
+        async with limite:
+            try:
+                if not upload.tamanho:
+                    raise HTTPException(400, "Empty file")
+                with esperando_vaga():
+                    resultado = await analisar_conteudo(upload, content_type, modo_ocr, preprocessamento)
+                return {"arquivo": nome, "resultado": resultado}
+            except HTTPException as e:
+                return {"arquivo": nome, "status": e.status_code, "erro": e.detail}
+            except Exception as e:
+                logger.exception("Falha ao processar %s no lote", nome)
+                return {"arquivo": nome, "status": 500, "erro": str(e)}
+
+    async def gerar_linhas():
+        tarefas = [asyncio.create_task(processar(*arquivo)) for arquivo in arquivos]
+        try:
+            for recusado in recusados:
+                yield json.dumps(recusado, ensure_ascii=False) + "\n"
+            for proxima in asyncio.as_completed(tarefas):
+                yield json.dumps(await proxima, ensure_ascii=False) + "\n"
+        finally:
+            # Cliente desconectou: não continua o OCR dos arquivos restantes
+            for tarefa in tarefas:
+                tarefa.cancel()
+            await asyncio.gather(*tarefas, return_exceptions=True)
+            limpar_apos_cache(chaves, temporarios)
+
+    # Se o gerador nem chegar a rodar, a limpeza fica por conta da background task
+    return StreamingResponse(
+        gerar_linhas(),
+        media_type="application/x-ndjson",
+        background=BackgroundTask(limpar_temporarios),
+    )
+
+@app.get("/analisar-pedido/status/{task_id}")
+def verificar_status_ocr(task_id: str):
+    from celery.result import AsyncResult
+    result = AsyncResult(task_id, app=celery_app)
+    if result.state == "PENDING":
+        return {"status": "PENDING"}
+    elif result.state == "SUCCESS":
+        return {"status": "SUCCESS", "result": result.result}
+    elif result.state == "FAILURE":
+        return {"status": "FAILURE", "error": str(result.result)}
+    else:
+        return {"status": result.state}
     
 @app.get("/")
 async def root():
@@ -381,17 +348,22 @@ async def root():
 
 @app.get("/health")
 async def health_check():
-    return {"status": "ok"}
+    return {
+        "status": "ok",
+        "ocr": pool_ocr.estatisticas(),
+        "cache_recibos": cache_recibos.estatisticas(),
+        "cache_geo": cache_geo.estatisticas(),
+    }
 
 @app.get("/verify-tesseract")
 async def verify_tesseract_endpoint():
     try:
-        langs = pytesseract.get_languages(config='')
+        langs = idiomas_disponiveis()
         if 'por' not in langs:
             raise RuntimeError("Portuguese language data not found")
         return True
     except Exception as e:
-        logger.error(f"Tesseract verification failed: {e}")
+        logger.error("Tesseract verification failed: %s", e)
         return False
 
 @app.get("/extrair-coordenadas")
@@ -513,7 +485,7 @@ def is_uuid(value: str) -> bool:
   
 @app.post("/roterizacao")
 def roterizacao(data: RoterizacaoInput):
-    print(f"Dados recebidos: {data}")
+    logger.info("Roteirização solicitada para %d motoboys", len(data.usuario_uids or []))
     try:
         # Verificar se os dados estão no formato correto
         if not isinstance(data, RoterizacaoInput):
@@ -532,8 +504,7 @@ def roterizacao(data: RoterizacaoInput):
         )
         return {"task_id": task.id}
     except Exception as e:
-        print(f"Erro ao processar roteirização: {e}")
-        logger.error(f"Erro ao processar roteirização: {e}")
+        logger.error("Erro ao processar roteirização: %s", e)
         return {"error": str(e)}
 
 @app.post("/roterizacao/inicio_entrega/{motoboy_uid}")
@@ -595,16 +566,16 @@ def marcar_entrega_concluida(order_id: int):
     supabase.table("orders").update({"status": "Entregue"}) \
         .eq("id", order_id).execute()
 
-    print(f"✅ Pedido {order_id} marcado como entregue")
+    logger.info("Pedido %s marcado como entregue", order_id)
     return {"status": "ok", "message": "Entrega marcada como concluída"}
 @app.post("/upload-planilha/")
 async def upload_planilha_excel(file: UploadFile = File(...)):
     if not file.filename == None and file.filename.endswith(".xlsx"):
         return JSONResponse(status_code=400, content={"error": "Arquivo deve ser .xlsx"})
 
-    contents = await file.read()
-    df = pd.read_excel(BytesIO(contents))
-    print(df.columns)  # Isso vai mostrar as colunas reais no terminal
+    async with salvar_upload(file, sufixo=".xlsx") as upload:
+        df = pd.read_excel(upload.caminho)
+    logger.debug("Colunas da planilha: %s", list(df.columns))
 
     created_variations = {}
     inserted_products = []
@@ -650,6 +621,8 @@ async def upload_planilha_excel(file: UploadFile = File(...)):
             supabase.table("products").insert(product).execute()
             inserted_products.append(product)
 
+    # Novas categorias passam a ser reconhecidas nos cupons sem reiniciar a API
+    invalidar_catalogo()
     return {"message": "Produtos inseridos com sucesso!", "total": len(inserted_products)}
 
 @app.post("/upload/")
@@ -657,9 +630,9 @@ async def upload_planilha(file: UploadFile = File(...)):
     if not file.filename == None and file.filename.endswith(".xlsx"):
         return JSONResponse(status_code=400, content={"error": "Arquivo deve ser .xlsx"})
 
-    contents = await file.read()
-    df = pd.read_excel(BytesIO(contents))
-    print(df.columns)  # Isso vai mostrar as colunas reais no terminal
+    async with salvar_upload(file, sufixo=".xlsx") as upload:
+        df = pd.read_excel(upload.caminho)
+    logger.debug("Colunas da planilha: %s", list(df.columns))
 
     created_variations = {}
     inserted_products = []
@@ -677,7 +650,7 @@ async def upload_planilha(file: UploadFile = File(...)):
     for _, row in df.iterrows():
         nome_produto = str(row["Nome"]).strip()
 
-        print(f"Processando produto: {nome_produto}")
+        logger.debug("Processando produto: %s", nome_produto, extra=amostrado())
       
         # Ignorar produtos já cadastrados
         if nome_produto in nomes_cadastrados:
@@ -703,7 +676,7 @@ async def upload_planilha(file: UploadFile = File(...)):
                     variation_response = supabase.table("variations").insert(variation_data).execute()
                     id_variation = variation_response.data[0]["id"]
                 except Exception as e:
-                    print(f"Erro ao inserir variação para {nome_produto}: {str(e)}")
+                    logger.warning("Erro ao inserir variação para %s: %s", nome_produto, e)
                     continue
 
             # Adicionar a variação ao dicionário
@@ -722,14 +695,15 @@ async def upload_planilha(file: UploadFile = File(...)):
         try:
             product_response = supabase.table("products").insert(product_data).execute()
             if product_response.error: # type: ignore
-                print(f"Erro ao inserir produto {nome_produto}: {product_response.error.message}") # type: ignore
+                logger.warning("Erro ao inserir produto %s: %s", nome_produto, product_response.error.message) # type: ignore
                 continue
         except Exception as e:
-            print(f"Erro ao inserir produto {nome_produto}: {str(e)}")
+            logger.warning("Erro ao inserir produto %s: %s", nome_produto, e)
             continue
 
         produtos_importados.append(product_data)
 
+    invalidar_catalogo()
     return {
         "importados": produtos_importados,
         "ignorados": list(nomes_cadastrados)
@@ -739,6 +713,17 @@ async def upload_planilha(file: UploadFile = File(...)):
 def start_realtime_on_startup():
     threading.Thread(target=start_realtime, daemon=True).start()
 
+@app.on_event("startup")
+async def iniciar_pool_ocr():
+    pool_ocr.iniciar()
+    await asyncio.to_thread(carregar_catalogo)
+    await asyncio.to_thread(carregar_indices)
+    await asyncio.to_thread(carregar_geocoder_local)
+
+@app.on_event("shutdown")
+async def encerrar_pool_ocr():
+    await pool_ocr.encerrar()
+
 import sys
 import traceback
 
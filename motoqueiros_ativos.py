@@ -10,7 +10,7 @@ def have_orders_in_progress(motoboy_uid: uuid.UUID) -> Optional[uuid.UUID]:
         .eq("in_progress", True) \
         .eq("motoboy_uid", motoboy_uid) \
         .limit(1).execute()
-    logger.info(f"Ultimo checkin: {res.data}")
+    logger.info("Ultimo checkin: %s", res.data)
     logger.info(res)
     if res.data:
         return uuid.UUID(res.data[0]["id"])
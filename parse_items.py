@@ -1,27 +1,152 @@
+import os
 import re
-from typing import Dict, List
+import threading
+import time
+import unicodedata
+from typing import Dict, Iterable, List, Optional
 import logging
 
-# Configuração do logger
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Categorias reconhecidas mesmo sem o catálogo (Supabase fora do ar, testes offline)
+CATEGORIAS_PADRAO = (
+    "PIZZA GIGANTE", "PIZZA GRANDE", "PIZZA MÉDIA", "PIZZA PEQUENA", "REFRIGERANTE",
+    "MARMITEX", "AÇAÍ", "LANCHES", "HAMBÚRGUER", "SOBREMESA", "SALGADO", "PORÇÃO",
+    "PRATO", "COMBO",
+)
+# Desligue para não consultar a tabela variations (benchmarks, execução offline)
+ITENS_CATALOGO_SUPABASE = os.getenv("ITENS_CATALOGO_SUPABASE", "1") == "1"
+ITENS_CATALOGO_TTL_SEGUNDOS = int(os.getenv("ITENS_CATALOGO_TTL_SEGUNDOS", "600"))
+
+PADRAO_PRECO = re.compile(r"\d+,\d{2}")
+# Rótulos que encerram uma observação de várias linhas
+PADRAO_FIM_OBSERVACAO = r"TOTAL ITENS:|TAXA DE ENTREGA:|VALOR DO PEDIDO:|FORMA DE PAGAMENTO:|BANDEIRA DO CARTÃO:|TEMPO P/ ENTREGA:"
+
+# Tipos de linha na ordem de prioridade; o primeiro que casar define a linha.
+# O início de item vem do catálogo e é inserido na frente desta lista.
+PADROES_LINHA = (
+    ("rotulo_borda", r"BORDA:$"),
+    ("rotulo_observacao", r"OBSERVAÇ(?:ÕES|ÃO):$"),
+    ("borda", r">>\s*(?P<texto_borda>.+)$"),
+    ("observacao", r"\s*obs\.?\s*cliente:\s*(?P<texto_observacao>.+)$"),
+    ("acrescimo", r"\s*c/\s*(?P<texto_acrescimo>[A-Z0-9ÇÃÕÂÊÁÉÍÓÚ a-z\/]+)$"),
+    ("decrescimo", r"\s*s/\s*(?P<texto_decrescimo>[A-Z0-9ÇÃÕÂÊÁÉÍÓÚ a-z\/]+)$"),
+    ("sabor", r"\s*(\d/\d)?\s*[-:]?\s*(?P<texto_sabor>[A-Z0-9ÇÃÕÂÊÁÉÍÓÚ a-z\/]+)$"),
+    ("preco", PADRAO_PRECO.pattern),
+    ("fim_observacao", PADRAO_FIM_OBSERVACAO),
+)
+
+
+def _tokens_termo(termo: str) -> List[str]:
+    """Quebra o termo em pedaços de regex: espaço vira \\s+ e letra acentuada aceita a versão sem acento."""
+    tokens = []
+    for letra in " ".join(termo.upper().split()):
+        if letra == " ":
+            tokens.append(r"\s+")
+            continue
+        base = unicodedata.normalize("NFD", letra)[0]
+        tokens.append(f"[{letra}{base}]" if base != letra else re.escape(letra))
+    return tokens
+
+
+def _regex_trie(no: Dict) -> str:
+    # Basta o item começar com um dos termos, então um termo completo dispensa os mais longos
+    if None in no:
+        return ""
+    alternativas = [token + _regex_trie(filho) for token, filho in sorted(no.items())]
+    return alternativas[0] if len(alternativas) == 1 else f"(?:{'|'.join(alternativas)})"
+
+
+def compilar_termos(termos: Iterable[str]) -> str:
+    """Monta uma trie com os termos e a converte numa única alternação sem prefixos repetidos."""
+    trie: Dict = {}
+    for termo in termos:
+        tokens = _tokens_termo(termo)
+        if not tokens:
+            continue
+        no = trie
+        for token in tokens:
+            no = no.setdefault(token, {})
+        no[None] = {}
+    return _regex_trie(trie)
+
+
+def compilar_gramatica(termos: Iterable[str]) -> re.Pattern:
+    """Uma regex por linha: cada tipo de linha é um grupo nomeado, despachado pelo lastgroup."""
+    alternativas = [f"(?P<item>\\d+\\s+{compilar_termos(termos)})"]
+    alternativas += [f"(?P<{nome}>{padrao})" for nome, padrao in PADROES_LINHA]
+    return re.compile("^(?:" + "|".join(alternativas) + ")", re.IGNORECASE)
+
+
+def _termos_catalogo() -> List[str]:
+    """Categorias (e categoria + tamanho) cadastradas na tabela variations."""
+    from load_files import supabase
+
+    resposta = supabase.table("variations").select("category, size").execute()
+    termos = []
+    for variacao in resposta.data or []:
+        categoria = (variacao.get("category") or "").strip()
+        if not categoria:
+            continue
+        termos.append(categoria)
+        tamanho = (variacao.get("size") or "").strip()
+        if tamanho and tamanho.upper() != "UNICO":
+            termos.append(f"{categoria} {tamanho}")
+    return termos
+
+
+class _Gramatica:
+    def __init__(self):
+        self.padrao: Optional[re.Pattern] = None
+        self.carregada_em = 0.0
+        self.atualizando = False
+        self.lock = threading.Lock()
+
+
+_gramatica = _Gramatica()
+
+
+def carregar_catalogo() -> re.Pattern:
+    """Recompila a gramática com as categorias atuais do catálogo."""
+    termos = list(CATEGORIAS_PADRAO)
+    if ITENS_CATALOGO_SUPABASE:
+        try:
+            termos += _termos_catalogo()
+        except Exception as e:
+            logger.warning("Falha ao carregar categorias do catálogo, usando as padrão: %s", e)
+    padrao = compilar_gramatica(termos)
+    with _gramatica.lock:
+        _gramatica.padrao = padrao
+        _gramatica.carregada_em = time.monotonic()
+        _gramatica.atualizando = False
+    return padrao
+
+
+def invalidar_catalogo() -> None:
+    """Força a recarga na próxima linha analisada (após cadastrar produtos)."""
+    with _gramatica.lock:
+        _gramatica.carregada_em = 0.0
+
+
+def obter_gramatica() -> re.Pattern:
+    """
+    Só a primeira carga bloqueia; depois do TTL a gramática atual continua em uso
+    enquanto a nova é carregada em segundo plano.
+    """
+    with _gramatica.lock:
+        padrao = _gramatica.padrao
+        expirada = time.monotonic() - _gramatica.carregada_em > ITENS_CATALOGO_TTL_SEGUNDOS
+        if padrao is not None and expirada and not _gramatica.atualizando:
+            _gramatica.atualizando = True
+            threading.Thread(target=carregar_catalogo, daemon=True).start()
+    if padrao is None:
+        return carregar_catalogo()
+    return padrao
+
+
 def parse_items(linhas: List[str]) -> List[Dict]:
     itens = []
-
-    padrao_item = re.compile(
-        r"^(\d+)\s+(PIZZA\s+GIGANTE|PIZZA\s+GRANDE|PIZZA\s+M[ÉE]DIA|PIZZA\s+PEQUENA|REFRIGERANTE|MARMITEX|AÇA[IÍ]|LANCHES|HAMB[ÚU]RGUER|SOBREMESA|SALGADO|POR[CÇ][AÃ]O|PRATO|COMBO)",
-        re.IGNORECASE
-    )
-    padrao_preco = re.compile(r"\d+,\d{2}")
-    padrao_sabor_fracionado = re.compile(r"^\s*(\d/\d)?\s*[-:]?\s*([A-Z0-9ÇÃÕÂÊÁÉÍÓÚ a-z\/]+)$", re.IGNORECASE)
-    padrao_borda = re.compile(r'^>>\s*(.+)$', re.IGNORECASE)
-    # padrao_acrescimo = exemplo: c/ cebola, c/ azeitona, c/ bacon
-    padrao_acrescimo = re.compile(r'^\s*c/\s*([A-Z0-9ÇÃÕÂÊÁÉÍÓÚ a-z\/]+)$', re.IGNORECASE)
-    # padrao_decrescimo = exemplo: s/ cebola, s/ azeitona, s/ bacon
-    padrao_decrescimo = re.compile(r'^\s*s/\s*([A-Z0-9ÇÃÕÂÊÁÉÍÓÚ a-z\/]+)$', re.IGNORECASE)
-    # padrao_observacao = exemplo: obs. cliente: sem cebola, obs. cliente: sem azeitona, obs. cliente: sem bacon
-    padrao_observacao = re.compile(r'^\s*obs\.?\s*cliente:\s*(.+)$', re.IGNORECASE)
+    padrao_linha = obter_gramatica()
 
     item_atual = None
 
@@ -34,9 +159,11 @@ def parse_items(linhas: List[str]) -> List[Dict]:
         if not linha:
             continue
 
+        match_linha = padrao_linha.match(linha)
+        tipo = match_linha.lastgroup if match_linha else None
+
         # Início de novo item
-        match_item = padrao_item.match(linha)
-        if match_item:
+        if tipo == "item":
             if item_atual:
                 # Salva observação acumulada, se houver
                 if buffer_observacao:
@@ -46,7 +173,7 @@ def parse_items(linhas: List[str]) -> List[Dict]:
             partes = linha.split()
             qtd = partes[0]
             descricao = " ".join(partes[1:-1])
-            preco = partes[-1] if padrao_preco.match(partes[-1]) else None
+            preco = partes[-1] if PADRAO_PRECO.match(partes[-1]) else None
 
             item_atual = {
                 "quantidade": qtd,
@@ -69,67 +196,58 @@ def parse_items(linhas: List[str]) -> List[Dict]:
 
         # Se linha anterior era 'BORDA:', pega borda agora
         if aguardando_borda:
-            match_borda = padrao_borda.match(linha)
-            if match_borda:
-                item_atual["borda"] = match_borda.group(1).strip().title()
+            if tipo == "borda":
+                item_atual["borda"] = match_linha.group("texto_borda").strip().title() # type: ignore
             else:
                 item_atual["borda"] = linha.title()
             aguardando_borda = False
             continue
 
         # Detecta se linha é só 'BORDA:'
-        if linha.upper() == "BORDA:":
+        if tipo == "rotulo_borda":
             aguardando_borda = True
             continue
 
         # Detecta se linha é só 'OBSERVAÇÕES:' ou 'OBSERVAÇÃO:'
-        if linha.upper() in ("OBSERVAÇÕES:", "OBSERVAÇÃO:"):
+        if tipo == "rotulo_observacao":
             aguardando_observacao = True
             continue
 
         # Borda padrão (linha já vem com >>)
-        match_borda = padrao_borda.match(linha)
-        if match_borda:
-            item_atual["borda"] = match_borda.group(1).strip().title()
+        if tipo == "borda":
+            item_atual["borda"] = match_linha.group("texto_borda").strip().title() # type: ignore
             continue
 
         # Observação do cliente padrão (pode ser multiline)
-        match_observacao = padrao_observacao.match(linha)
-        if match_observacao:
-            buffer_observacao = [match_observacao.group(1).strip()]
+        if tipo == "observacao":
+            buffer_observacao = [match_linha.group("texto_observacao").strip()] # type: ignore
             aguardando_observacao = True
             continue
 
         # Acréscimo
-        match_acrescimo = padrao_acrescimo.match(linha)
-        if match_acrescimo:
-            sabor = match_acrescimo.group(1).strip().title()
-            item_atual["acrescimo"].append(sabor)
+        if tipo == "acrescimo":
+            item_atual["acrescimo"].append(match_linha.group("texto_acrescimo").strip().title()) # type: ignore
             continue
 
         # Decrescimo
-        match_decrescimo = padrao_decrescimo.match(linha)
-        if match_decrescimo:
-            sabor = match_decrescimo.group(1).strip().title()
-            item_atual["decrescimo"].append(sabor)
+        if tipo == "decrescimo":
+            item_atual["decrescimo"].append(match_linha.group("texto_decrescimo").strip().title()) # type: ignore
             continue
 
         # Sabores com ou sem fração
-        match_sabor = padrao_sabor_fracionado.match(linha)
-        if match_sabor:
-            sabor = match_sabor.group(2).strip().title()
-            item_atual["sabores"].append(sabor)
+        if tipo == "sabor":
+            item_atual["sabores"].append(match_linha.group("texto_sabor").strip().title()) # type: ignore
             continue
 
         # Preço separado
-        if padrao_preco.match(linha):
+        if tipo == "preco":
             item_atual["preco"] = linha
             continue
 
         # Se está acumulando observação, adiciona linha
         if aguardando_observacao:
             # Se a linha indica início de outro campo, para de acumular observação
-            if re.match(r"^(TOTAL ITENS:|TAXA DE ENTREGA:|VALOR DO PEDIDO:|FORMA DE PAGAMENTO:|BANDEIRA DO CARTÃO:|TEMPO P/ ENTREGA:)", linha, re.IGNORECASE):
+            if tipo == "fim_observacao":
                 aguardando_observacao = False
                 item_atual["observacao"] = " ".join(buffer_observacao).strip()
                 buffer_observacao = []
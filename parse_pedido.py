@@ -0,0 +1,292 @@
+import re
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+from load_files import logger
+from models import Endereco
+from parse_items import parse_items
+
+PADRAO_ENDERECO = re.compile(
+    r"ENDEREÇO:\s*([^,]+),\s*(\d+)(?:\s*\(([^)]+)\))?,\s*([^,]+),\s*([^/]+)/([A-Z]{2})",
+    flags=re.IGNORECASE
+)
+# O rótulo opcional ("TEL:", "CELULAR:"...) não muda os números encontrados
+# pelo findall e deixava a busca bem mais lenta, então ficou de fora
+PADRAO_TELEFONE = re.compile(r"\(?(\d{2})\)?\s*[-]?(\d{1,2})?[-]?(\d{4,5})[-]?(\d{4})")
+PADRAO_PAGAMENTO = re.compile(r'(?i)(?:CART[\u00c3A]O\s*(?:DE\s*)?(?:D[\u00c9E]BITO|CRÉDITO)|PIX|DINHEIRO|PAGAR\s*NO\s*LOCAL)')
+
+def _endereco_do_match(match: re.Match) -> Endereco:
+    rua = match.group(1).replace(",", "").strip()
+    numero = match.group(2).strip()
+    referencia = match.group(3).strip() if match.group(3) else None
+    bairro = match.group(4).strip()
+    cidade = match.group(5).strip()
+    estado = match.group(6).strip()
+
+    complemento = f"Referência: {referencia}" if referencia else None
+
+    return Endereco(
+        rua=rua,
+        numero=numero,
+        bairro=bairro,
+        cidade=cidade,
+        estado=estado,
+        complemento=complemento,
+        datetime=datetime.now(timezone.utc),
+    )
+
+def parse_endereco(texto: str) -> Optional[Endereco]:
+    match = PADRAO_ENDERECO.search(texto)
+    if not match:
+        return None
+    return _endereco_do_match(match)
+
+def extrair_telefone(texto: str) -> str:
+    """
+    Extrai o segundo telefone brasileiro do texto com correção de erros comuns de OCR.
+    Ignora números que não seguem o padrão de telefone válido.
+    Se não encontrar um segundo número, retorna o primeiro.
+    Exemplo: (16) -0737-3515 → 16997373515
+    """
+    # Encontrar todos os números no texto
+    matches = PADRAO_TELEFONE.findall(texto)
+    logger.debug("Telefones candidatos encontrados: %d", len(matches))
+
+    if not matches:
+        return "Número não encontrado"
+
+    # Formatar os números encontrados
+    numeros = []
+    for match in matches:
+        ddd = match[0]
+        numero = (match[1] or "") + match[2] + match[3]
+        telefone = f"{ddd}{numero}"
+
+        # Verificar se o número tem 10 ou 11 dígitos (padrão de telefone brasileiro)
+        if len(telefone) in [10, 11]:
+            numeros.append(telefone)
+
+    # Retornar o segundo número válido, se existir, ou o primeiro
+    if len(numeros) > 1:
+        return numeros[len(numeros) - 1]
+    elif numeros:
+        return numeros[0]
+
+    return "Número não encontrado"
+  
+def extract_clean_payment(text: str) -> str:
+    try:
+        match = PADRAO_PAGAMENTO.search(text)
+        if match:
+            payment = match.group(0).title()
+            payment = (payment.replace("Cartao", "Cartão")
+                              .replace("Debito", "Débito")
+                              .replace("Credito", "Crédito"))
+            return payment
+    except Exception as e:
+        logger.error("Payment extraction error: %s", e)
+
+    return "Não Especificado"
+
+
+# Padrão completo de cada campo do cupom. O texto já chega em maiúsculas.
+PADRAO_TIPO_VENDA = re.compile(r"(ENTREGA|RETIRAR|BALCAO|MESA)\s*(\d{1,5})?")
+PADRAO_DATA_HORA = re.compile(r"(\d{2}/\d{2}/\d{4})\s*ÀS\s*(\d{2}:\d{2}:\d{2})")
+PADROES_ROTULOS = {
+    "cliente": re.compile(r"CLIENTE:\s*(.+?)(?:\n|$)"),
+    "email": re.compile(r"EMAIL:\s*([^\n]+)"),
+    "origem": re.compile(r"ORIGEM:\s*(.+?)(?:\n|$)"),
+    "atendente": re.compile(r"ATENDENTE:\s*(.+?)(?:\n|$)"),
+    "endereco": PADRAO_ENDERECO,
+    "total_itens": re.compile(r"TOTAL ITENS:\s*([\d.,]+)"),
+    "taxa_entrega": re.compile(r"TAXA DE ENTREGA:\s*\+?\s*([\d.,]+)"),
+    "valor_total": re.compile(r"VALOR\s*DO\s*PEDIDO:\s*(R\$)?\s*([^\n]+)"),
+    "forma_pagamento": re.compile(r"(?:FORMA\s*DE\s*PAGAMENTO|PAGAMENTO)\s*:\s*([^\n]+)"),
+    "tempo_entrega": re.compile(r"TEMPO P/ ENTREGA:\s*(\d+)\s*MIN\s*\|\s*(\d{2}:\d{2}:\d{2})"),
+    "observacoes": re.compile(r"OBSERVAÇÕES:\s*(.+?)(?:\n|$)"),
+}
+
+# Uma varredura encontra todos os rótulos; o rótulo (sem espaços) indica o campo
+# e o padrão do campo é aplicado a partir dali. Os rótulos terminam em ":" e
+# nenhum contém o início de outro, então o primeiro rótulo válido de cada campo
+# dá o mesmo resultado que um re.search do padrão do campo no texto inteiro.
+# Sem grupos nomeados o re consegue pular direto para as letras iniciais.
+PADRAO_ROTULOS = re.compile(
+    r"CLIENTE:|EMAIL:|ORIGEM:|ATENDENTE:|ENDEREÇO:|TOTAL ITENS:|TAXA DE ENTREGA:"
+    r"|VALOR\s*DO\s*PEDIDO:|(?:FORMA\s*DE\s*)?PAGAMENTO\s*:|TEMPO P/ ENTREGA:|OBSERVAÇÕES:"
+)
+CAMPOS_POR_ROTULO = {
+    "CLIENTE:": "cliente",
+    "EMAIL:": "email",
+    "ORIGEM:": "origem",
+    "ATENDENTE:": "atendente",
+    "ENDEREÇO:": "endereco",
+    "TOTALITENS:": "total_itens",
+    "TAXADEENTREGA:": "taxa_entrega",
+    "VALORDOPEDIDO:": "valor_total",
+    "FORMADEPAGAMENTO:": "forma_pagamento",
+    "PAGAMENTO:": "forma_pagamento",
+    "TEMPOP/ENTREGA:": "tempo_entrega",
+    "OBSERVAÇÕES:": "observacoes",
+}
+PADRAO_VALOR_LINHA = re.compile(r"(\d+,\d{2})")
+
+def localizar_campos(texto: str) -> Dict[str, re.Match]:
+    """Primeiro match de cada campo rotulado do cupom, em uma passada pelo texto."""
+    encontrados: Dict[str, re.Match] = {}
+    for rotulo in PADRAO_ROTULOS.finditer(texto):
+        campo = CAMPOS_POR_ROTULO["".join(rotulo.group().split())]
+        if campo in encontrados:
+            continue
+        match = PADROES_ROTULOS[campo].match(texto, rotulo.start())
+        if match:
+            encontrados[campo] = match
+            if len(encontrados) == len(PADROES_ROTULOS):
+                break
+    return encontrados
+
+def parse_campos(texto: str) -> Dict:
+    texto = texto.upper()
+    resultado = {}
+    campos = localizar_campos(texto)
+
+    tipo_match = PADRAO_TIPO_VENDA.search(texto)
+    if tipo_match:
+        resultado["tipo_venda"] = tipo_match.group(1).capitalize()
+        if tipo_match.group(2):
+            resultado["senha"] = tipo_match.group(2)
+
+    data_match = PADRAO_DATA_HORA.search(texto)
+    if data_match:
+        resultado["data_hora"] = datetime.strptime(
+            f"{data_match.group(1)} {data_match.group(2)}",
+            "%d/%m/%Y %H:%M:%S"
+        )
+
+    cliente_match = campos.get("cliente")
+    if cliente_match:
+        resultado["cliente"] = cliente_match.group(1).strip().title()
+
+    email_match = campos.get("email")
+    if email_match:
+        resultado["email"] = email_match.group(1).strip()
+
+    resultado["telefone"] = extrair_telefone(texto)
+
+    resultado["novo_cliente"] = "NOVO CLIENTE" in texto
+
+    origem_match = campos.get("origem")
+    if origem_match:
+        resultado["origem"] = origem_match.group(1).strip()
+
+    atendente_match = campos.get("atendente")
+    if atendente_match:
+        resultado["atendente"] = atendente_match.group(1).strip()
+
+    endereco_match = campos.get("endereco")
+    resultado["endereco"] = _endereco_do_match(endereco_match) if endereco_match else None
+
+    linhas = [linha.strip() for linha in texto.splitlines() if linha.strip()]
+    resultado["items"] = parse_items(linhas)
+
+    total_itens_match = campos.get("total_itens")
+    if total_itens_match:
+        resultado["total_itens"] = total_itens_match.group(1)
+
+    taxa_match = campos.get("taxa_entrega")
+    if taxa_match:
+        resultado["taxa_entrega"] = taxa_match.group(1)
+
+    valor_total_match = campos.get("valor_total")
+    
+    if valor_total_match:
+        resultado["valor_total"] = valor_total_match.group(2).strip()
+    else:
+        for linha in reversed(linhas):
+            valor_linha = PADRAO_VALOR_LINHA.search(linha)
+            if valor_linha:
+                resultado["valor_total"] = valor_linha.group(1)
+                break
+
+    payment_match = campos.get("forma_pagamento")
+    if payment_match:
+        raw_payment = ' '.join(payment_match.group(1).split())
+        resultado["forma_pagamento"] = extract_clean_payment(raw_payment)
+    else:
+        resultado["forma_pagamento"] = "Não Especificado"
+
+    tempo_match = campos.get("tempo_entrega")
+    if tempo_match:
+        resultado["tempo_entrega"] = f"{tempo_match.group(1)} min | {tempo_match.group(2)}"
+
+    observacoes_match = campos.get("observacoes")
+    if observacoes_match:
+        resultado["observacoes"] = observacoes_match.group(1).strip()
+
+    return resultado
+
+
+PADRAO_VALOR = re.compile(r"\d+,\d{2}")
+
+# Campo obrigatório -> se o valor extraído é plausível
+CAMPOS_OBRIGATORIOS = {
+    "cliente": lambda dados: len(dados.get("cliente") or "") >= 2,
+    # Retirada, balcão e mesa não têm endereço
+    "endereco": lambda dados: dados.get("tipo_venda", "Entrega") != "Entrega" or bool(dados.get("endereco")),
+    "items": lambda dados: bool(dados.get("items")),
+    "valor_total": lambda dados: bool(PADRAO_VALOR.search(dados.get("valor_total") or "")),
+}
+
+def campos_faltando(dados: Dict) -> List[str]:
+    """Campos obrigatórios ausentes ou implausíveis no resultado do parse_campos."""
+    return [campo for campo, plausivel in CAMPOS_OBRIGATORIOS.items() if not plausivel(dados)]
+
+
+PADRAO_LINHA_TIPO_VENDA = re.compile(r"^(ENTREGA|RETIRAR|BALCAO|MESA)\s*\d{0,5}$")
+PADRAO_DATA_PEDIDO = re.compile(r"\d{2}/\d{2}/\d{4}\s*ÀS")
+
+def _inicio_com_loja(normalizadas: List[str], anterior: int, inicio: int, loja: set) -> int:
+    """Recua o corte sobre as linhas da loja logo antes do cabeçalho, se forem as do primeiro pedido."""
+    corte = inicio
+    while corte - 1 > anterior and (normalizadas[corte - 1] in loja or not normalizadas[corte - 1]):
+        corte -= 1
+    # Só linhas em branco antes do cabeçalho ficam com o pedido anterior
+    while corte < inicio and not normalizadas[corte]:
+        corte += 1
+    return corte
+
+
+def dividir_recibos(paginas: List[str]) -> List[str]:
+    """
+    Separa exportações do PDV que trazem vários pedidos no mesmo PDF, a partir do
+    texto de cada página. Cada pedido começa pelo cabeçalho: a linha do tipo de venda
+    seguida da linha de data "ÀS". As linhas da loja acima do cabeçalho vão junto
+    com o pedido quando ele abre uma página nova ou quando são as mesmas linhas
+    que abrem o primeiro pedido; fora isso o corte é no próprio cabeçalho.
+    """
+    linhas: List[str] = []
+    quebras_pagina = []
+    for pagina in paginas:
+        quebras_pagina.append(len(linhas))
+        linhas.extend(pagina.splitlines())
+    normalizadas = [linha.strip().upper() for linha in linhas]
+
+    inicios = [
+        indice
+        for indice, linha in enumerate(normalizadas)
+        if PADRAO_LINHA_TIPO_VENDA.match(linha)
+        and any(PADRAO_DATA_PEDIDO.search(seguinte) for seguinte in normalizadas[indice + 1:indice + 3])
+    ]
+    if len(inicios) <= 1:
+        return ["\n".join(paginas)]
+
+    loja = {linha for linha in normalizadas[:inicios[0]] if linha}
+    cortes = [0]
+    for anterior, inicio in zip(inicios, inicios[1:]):
+        # Pedido que abre página nova: o topo da página (até o tamanho do topo do primeiro) é dele
+        quebra = max((q for q in quebras_pagina if anterior < q <= inicio), default=None)
+        if quebra is not None and inicio - quebra <= inicios[0]:
+            cortes.append(quebra)
+        else:
+            cortes.append(_inicio_com_loja(normalizadas, anterior, inicio, loja))
+    return ["\n".join(linhas[a:b]) for a, b in zip(cortes, cortes[1:] + [len(linhas)])]
@@ -0,0 +1,113 @@
+import asyncio
+from typing import Dict, List, Optional, Tuple, Union
+
+from load_files import logger
+from parse_pedido import campos_faltando, dividir_recibos, parse_campos
+from utils.correcao_ocr import corrigir_campos
+from utils.ocr import (
+    MODO_ADAPTATIVO,
+    NIVEIS_OCR,
+    Documento,
+    OCR_DPI_MAXIMO,
+    analisar_paginas_nativas,
+    extrair_paginas_ocr,
+    extrair_paginas_ocr_paralelo,
+    extrair_texto_imagem,
+)
+
+
+def niveis_para_modo(modo_ocr: str) -> Tuple[Dict, ...]:
+    if modo_ocr == MODO_ADAPTATIVO:
+        return NIVEIS_OCR
+    return ({"nivel": modo_ocr, "modo": modo_ocr, "dpi_maximo": OCR_DPI_MAXIMO},)
+
+
+def _ler_paginas_nativas(documento: Documento) -> Tuple[Optional[List[str]], int]:
+    """Texto nativo de cada página (None se insuficiente) e o número de páginas."""
+    try:
+        return analisar_paginas_nativas(documento)
+    except Exception as e:
+        logger.warning("Falha ao ler texto nativo do PDF: %s", e)
+        return None, 1
+
+
+def _avaliar_nivel(text: str, nivel: Dict) -> Tuple[Dict, bool]:
+    data = parse_campos(text)
+    # O texto nativo do PDF é exato: corrigir trocaria ruas novas por vizinhas cadastradas
+    if nivel["nivel"] != "nativo":
+        data = corrigir_campos(data)
+    faltando = campos_faltando(data)
+    if faltando:
+        logger.info("OCR nível %s incompleto, faltando %s", nivel['nivel'], faltando)
+    data["ocr_nivel"] = nivel["nivel"]
+    return data, not faltando
+
+
+def _avaliar_recibos_sincrono(paginas: List[str], nivel: Dict) -> Tuple[Union[Dict, List[Dict]], bool]:
+    """Um PDF com vários pedidos vira uma lista, com um resultado por pedido."""
+    recibos = dividir_recibos(paginas)
+    if len(recibos) == 1:
+        return _avaliar_nivel(recibos[0], nivel)
+    resultados = [_avaliar_nivel(recibo, nivel) for recibo in recibos]
+    return [data for data, _ in resultados], all(completo for _, completo in resultados)
+
+
+async def _avaliar_recibos(paginas: List[str], nivel: Dict) -> Tuple[Union[Dict, List[Dict]], bool]:
+    """O parse roda numa thread, fora do event loop; o pool de OCR fica só com o OCR."""
+    return await asyncio.to_thread(_avaliar_recibos_sincrono, paginas, nivel)
+
+
+async def analisar_com_escalonamento(
+    pool, documento: Documento, modo_ocr: str, preprocessamento: str
+) -> Union[Dict, List[Dict]]:
+    """
+    Roda o OCR começando pelo nível mais barato e só passa ao próximo quando
+    faltam campos obrigatórios. O nível usado volta em "ocr_nivel".
+    Quando o PDF traz vários pedidos, devolve uma lista com um resultado por pedido.
+    """
+    paginas_nativas, total_paginas = await asyncio.to_thread(_ler_paginas_nativas, documento)
+    if paginas_nativas is not None:
+        return (await _avaliar_recibos(paginas_nativas, {"nivel": "nativo"}))[0]
+
+    for nivel in niveis_para_modo(modo_ocr):
+        # Página a página: as quebras de página também separam os pedidos
+        paginas = await extrair_paginas_ocr_paralelo(
+            pool,
+            documento,
+            total_paginas,
+            modo=nivel["modo"],
+            preprocessamento=preprocessamento,
+            dpi_maximo=nivel["dpi_maximo"],
+        )
+        data, completo = await _avaliar_recibos(paginas, nivel)
+        if completo:
+            break
+    return data
+
+
+async def analisar_imagem(pool, documento: Documento, preprocessamento: str) -> Union[Dict, List[Dict]]:
+    """Foto do cupom: um único reconhecimento, sem OCRmyPDF nem rasterização de PDF."""
+    text = await pool.executar(extrair_texto_imagem, documento, preprocessamento)
+    return (await _avaliar_recibos([text], {"nivel": "imagem"}))[0]
+
+
+def analisar_com_escalonamento_sincrono(
+    documento: Documento, modo_ocr: str, preprocessamento: str
+) -> Union[Dict, List[Dict]]:
+    """Mesmo escalonamento, no processo atual; usado pelos workers do Celery."""
+    paginas_nativas, total_paginas = _ler_paginas_nativas(documento)
+    if paginas_nativas is not None:
+        return _avaliar_recibos_sincrono(paginas_nativas, {"nivel": "nativo"})[0]
+
+    for nivel in niveis_para_modo(modo_ocr):
+        paginas = extrair_paginas_ocr(
+            documento,
+            total_paginas,
+            modo=nivel["modo"],
+            preprocessamento=preprocessamento,
+            dpi_maximo=nivel["dpi_maximo"],
+        )
+        data, completo = _avaliar_recibos_sincrono(paginas, nivel)
+        if completo:
+            break
+    return data
@@ -6,7 +6,8 @@ from requests import RequestException
 from load_files import supabase, logger
 from celery_app import app as celery_app
 from motoqueiros_ativos import motoboys_ociosos, obtem_motoboys
-from utils.geo import get_coordenadas_com_cache, calcular_prioridade_por_tempo
+from utils.cliente_ors import obter_cliente
+from utils.geo import calcular_prioridade_por_tempo, resolver_coordenadas, texto_endereco
 from tasks_helpers import buscar_enderecos_para_entrega
 import openrouteservice
 from openrouteservice.optimization import Job, Vehicle
@@ -32,18 +33,27 @@ def reatribuir_entregas_para_motoboy_ocioso(self, api_key: str, pizzaria: str, c
         return {"error": "Nenhum entregador ocioso e ativo no momento"}
 
     
+    # Rotas e endereços de todas as entregas numa consulta cada
+    ids_pedidos = [ent.id_order for ent in todas_entregas]
+    rotas = supabase.table("routes").select("id_order, in_progress").in_("id_order", ids_pedidos).execute().data if ids_pedidos else []
+    # Já existe rota em andamento para esses pedidos, não incluir novamente
+    em_andamento = {r["id_order"] for r in rotas if r.get("in_progress")}
+    pendentes = [ent for ent in todas_entregas if ent.id_order not in em_andamento]
+
+    ids_enderecos = list({ent.id for ent in pendentes})
+    enderecos = {
+        e["id"]: e for e in supabase.table("address").select("*").in_("id", ids_enderecos).execute().data
+    } if ids_enderecos else {}
+    coordenadas_por_endereco = resolver_coordenadas(
+        [pizzaria, *(texto_endereco(e) for e in enderecos.values())], api_key=api_key
+    )
+
     entregas_disponiveis = []
-    for ent in todas_entregas:
-        rota = supabase.table("routes").select("*").eq("id_order", ent.id_order).execute().data
-        if rota and any(r.get("in_progress") for r in rota):
-            # Já existe rota em andamento para esse pedido, não incluir novamente
+    for ent in pendentes:
+        endereco = enderecos.get(ent.id)
+        if not endereco:
             continue
-
-        endereco = supabase.table("address").select("*").eq("id", ent.id).execute().data[0]
-        coordenadas = get_coordenadas_com_cache(
-            f"{endereco['street']}, {endereco['number']}, {endereco['district']}, Jardinópolis, SP",
-            api_key=api_key
-        )
+        coordenadas = coordenadas_por_endereco.get(texto_endereco(endereco))
         if not coordenadas:
             continue
         entrega = Endereco(
@@ -68,9 +78,9 @@ def reatribuir_entregas_para_motoboy_ocioso(self, api_key: str, pizzaria: str, c
     entregas_disponiveis.sort(key=lambda x: (-x.prioridade, x.datetime))
     entregas_selecionadas = entregas_disponiveis[:capacidade_maxima * len(todos_motoboys)]
     
-    print(f"Entregas selecionadas: {entregas_selecionadas}")
+    logger.info("Entregas selecionadas: %d de %d", len(entregas_selecionadas), len(entregas_disponiveis))
         
-    coord_pizzaria = get_coordenadas_com_cache(pizzaria, api_key=api_key)
+    coord_pizzaria = coordenadas_por_endereco.get(pizzaria)
     if not coord_pizzaria:
         return {"error": "Coordenadas da pizzaria não encontradas"}
 
@@ -104,7 +114,7 @@ def reatribuir_entregas_para_motoboy_ocioso(self, api_key: str, pizzaria: str, c
         )
         vehicles.append(vehicle)
 
-    client = openrouteservice.Client(key=api_key)
+    client = obter_cliente(api_key)
     result = client.optimization(jobs=jobs, vehicles=vehicles) # type: ignore
     
     for rota in result["routes"]:
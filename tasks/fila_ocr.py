@@ -0,0 +1,56 @@
+import os
+import uuid
+
+import redis
+from fastapi.encoders import jsonable_encoder
+
+from celery_app import app as celery_app, REDIS_URL
+from load_files import logger
+from pipeline_pedido import analisar_com_escalonamento_sincrono
+from utils.logs import contexto_log
+from utils.ocr import inicializar_trabalhador_ocr
+
+# Tempo que o PDF enviado fica guardado aguardando um worker de OCR
+OCR_PDF_TTL_SEGUNDOS = int(os.getenv("OCR_PDF_TTL_SEGUNDOS", "3600"))
+
+_redis = redis.Redis.from_url(REDIS_URL)
+
+
+def guardar_pdf(conteudo: bytes) -> str:
+    """Guarda o PDF no Redis para que workers em outras máquinas possam lê-lo."""
+    chave = f"ocr:pdf:{uuid.uuid4()}"
+    _redis.set(chave, conteudo, ex=OCR_PDF_TTL_SEGUNDOS)
+    return chave
+
+
+_motor_carregado = False
+
+
+def carregar_motor_ocr() -> None:
+    """
+    Carrega o motor de OCR na primeira tarefa de OCR do processo, e não no
+    worker_process_init: os workers das outras filas também importam este módulo.
+    """
+    global _motor_carregado
+    if not _motor_carregado:
+        inicializar_trabalhador_ocr()
+        _motor_carregado = True
+
+
+def registrar_falha_ocr(self, exc, task_id, args, kwargs, einfo):
+    """on_failure da tarefa: o Celery passa a exceção e o traceback, não uma mensagem."""
+    logger.error("Falha no OCR %s: %s", task_id, exc, exc_info=einfo.exc_info)
+
+
+@celery_app.task(bind=True, on_failure=registrar_falha_ocr)
+def analisar_pedido_ocr(self, chave_pdf: str, modo_ocr: str, preprocessamento: str):
+    conteudo = _redis.get(chave_pdf)
+    if conteudo is None:
+        raise ValueError(f"PDF {chave_pdf} não encontrado ou expirado")
+    try:
+        carregar_motor_ocr()
+        with contexto_log(etapa="ocr"):
+            dados = analisar_com_escalonamento_sincrono(conteudo, modo_ocr, preprocessamento)
+        return jsonable_encoder(dados)
+    finally:
+        _redis.delete(chave_pdf)
@@ -1,10 +1,11 @@
 from datetime import datetime
 import uuid
 import openrouteservice
-from load_files import supabase
+from load_files import logger, supabase
 from funcoes_supabase import contar_pizzas_no_supabase
 from models import Endereco, RoterizacaoInput
-from utils.geo import get_coordenadas_com_cache
+from utils.geo import resolver_coordenadas, texto_endereco
+from utils.logs import amostrado, contexto_log
 
 def entregador_ocioso(motoboy_uid: uuid.UUID) -> bool:
     rotas_ativas = supabase.table("routes").select("id").eq("motoboy_uid", motoboy_uid).eq("concluido", False).execute()
@@ -17,7 +18,7 @@ def buscar_enderecos_para_entrega(data: RoterizacaoInput) -> list[Endereco]:
         .order("prioritaria", desc=True) \
         .order("datetime", desc=False) \
         .execute()
-    print(f"Endereços encontrados: {orders.data}")
+    logger.info("Pedidos aguardando entrega: %d", len(orders.data))
     address_ids = [o["address"] for o in orders.data if o.get("address")]
 
     if not address_ids:
@@ -29,40 +30,46 @@ def buscar_enderecos_para_entrega(data: RoterizacaoInput) -> list[Endereco]:
         .execute()
 
     entregas = []
+    enderecos_por_id = {a["id"]: a for a in addresses.data}
+    # Todos os endereços do ciclo resolvidos de uma vez
+    coordenadas = resolver_coordenadas(
+        (texto_endereco(a) for a in enderecos_por_id.values()), api_key=data.api_key
+    )
 
     for order in orders.data:
-      endereco = next((a for a in addresses.data if a["id"] == order["address"]), None)
-      if not endereco:
-          continue
+      with contexto_log(id_pedido=order["id"]):
+          endereco = enderecos_por_id.get(order["address"])
+          if not endereco:
+              continue
 
-      coordenadas_cliente = get_coordenadas_com_cache(f"{endereco['street']}, {endereco['number']}, {endereco['district']}, Jardinópolis, SP", api_key=data.api_key)
-      if coordenadas_cliente and (endereco["latitude"] != coordenadas_cliente[0] or endereco["longitude"] != coordenadas_cliente[1]):
-          # Atualizar coordenadas no banco de dados
-          supabase.table("address").update({
-              "latitude": coordenadas_cliente[0],
-              "longitude": coordenadas_cliente[1]
-          }).eq("id", endereco["id"]).execute()
-          print(f"🔄 Coordenadas atualizadas para o endereço {endereco['street']}.")
-      if not coordenadas_cliente:
-          print(f"⚠️ Ignorando endereço '{endereco['street']}' devido à falta de coordenadas.")
-          continue  # Ignorar este endereço e passar para o próximo
+          coordenadas_cliente = coordenadas.get(texto_endereco(endereco))
+          if coordenadas_cliente and (endereco["latitude"] != coordenadas_cliente[0] or endereco["longitude"] != coordenadas_cliente[1]):
+              # Atualizar coordenadas no banco de dados
+              supabase.table("address").update({
+                  "latitude": coordenadas_cliente[0],
+                  "longitude": coordenadas_cliente[1]
+              }).eq("id", endereco["id"]).execute()
+              logger.debug("Coordenadas do endereço %s atualizadas", endereco["id"], extra=amostrado())
+          if not coordenadas_cliente:
+              logger.warning("Ignorando endereço %s sem coordenadas", endereco["id"])
+              continue  # Ignorar este endereço e passar para o próximo
 
-      order_datetime = datetime.fromisoformat(order["datetime"]) if order.get("datetime") else datetime.now()
+          order_datetime = datetime.fromisoformat(order["datetime"]) if order.get("datetime") else datetime.now()
 
-      qtd_pizza = contar_pizzas_no_supabase(id_order=order["id"])
-      entregas.append(Endereco(
-          id=endereco["id"],
-          id_order=order["id"],
-          rua=endereco["street"],
-          numero=str(endereco["number"]),
-          bairro=endereco["district"],
-          cidade="Jardinópolis",
-          estado="SP",
-          quantidade_pizzas=qtd_pizza,
-          prioridade=order["prioritaria"],
-          datetime=order_datetime,
-          latitude=coordenadas_cliente[0],
-          longitude=coordenadas_cliente[1]
-      ))
+          qtd_pizza = contar_pizzas_no_supabase(id_order=order["id"])
+          entregas.append(Endereco(
+              id=endereco["id"],
+              id_order=order["id"],
+              rua=endereco["street"],
+              numero=str(endereco["number"]),
+              bairro=endereco["district"],
+              cidade="Jardinópolis",
+              estado="SP",
+              quantidade_pizzas=qtd_pizza,
+              prioridade=order["prioritaria"],
+              datetime=order_datetime,
+              latitude=coordenadas_cliente[0],
+              longitude=coordenadas_cliente[1]
+          ))
 
     return entregas
\ No newline at end of file
@@ -0,0 +1,153 @@
+import json
+import os
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import redis
+
+from celery_app import REDIS_URL
+from load_files import logger
+from utils.lru import CacheLRU
+
+# Coordenadas ficam numa LRU do processo e no Redis, compartilhadas entre a API e os workers
+CACHE_GEO_MAX_ITENS = int(os.getenv("CACHE_GEO_MAX_ITENS", "4096"))
+CACHE_GEO_TTL_SEGUNDOS = int(os.getenv("CACHE_GEO_TTL_SEGUNDOS", str(30 * 24 * 3600)))
+# Endereços sem resultado são tentados de novo depois de pouco tempo
+CACHE_GEO_TTL_NEGATIVO_SEGUNDOS = int(os.getenv("CACHE_GEO_TTL_NEGATIVO_SEGUNDOS", "600"))
+# A LRU expira antes do Redis para enxergar correções feitas por outro processo
+CACHE_GEO_TTL_MEMORIA_SEGUNDOS = int(os.getenv("CACHE_GEO_TTL_MEMORIA_SEGUNDOS", "3600"))
+CACHE_GEO_REDIS = os.getenv("CACHE_GEO_REDIS", "1") == "1"
+CACHE_GEO_PREFIXO = "geo:coord:"
+# Com o Redis fora do ar, só tenta de novo depois desse intervalo
+CACHE_GEO_REDIS_PAUSA_SEGUNDOS = 30
+
+_NEGATIVO = object()
+
+
+class CacheGeo:
+    """
+    Cache de coordenadas em dois níveis: LRU em memória na frente e Redis com TTL.
+    Resultados vazios são guardados à parte, com TTL curto. Falhas do Redis não
+    propagam: o cache só perde o nível compartilhado até o Redis voltar.
+    """
+
+    def __init__(
+        self,
+        max_itens: int = CACHE_GEO_MAX_ITENS,
+        ttl_segundos: int = CACHE_GEO_TTL_SEGUNDOS,
+        ttl_negativo_segundos: int = CACHE_GEO_TTL_NEGATIVO_SEGUNDOS,
+        ttl_memoria_segundos: int = CACHE_GEO_TTL_MEMORIA_SEGUNDOS,
+        redis_url: Optional[str] = REDIS_URL if CACHE_GEO_REDIS else None,
+    ):
+        self._memoria = CacheLRU(max_itens, ttl_segundos=ttl_memoria_segundos)
+        self.ttl_segundos = ttl_segundos
+        self.ttl_negativo_segundos = ttl_negativo_segundos
+        self.ttl_memoria_segundos = ttl_memoria_segundos
+        self._redis = (
+            redis.Redis.from_url(redis_url, socket_timeout=0.5, socket_connect_timeout=0.5)
+            if redis_url else None
+        )
+        self._redis_pausado_ate = 0.0
+        self._lock = threading.Lock()
+
+        self.hits_memoria = 0
+        self.hits_redis = 0
+        self.hits_negativos = 0
+        self.misses = 0
+        self.erros_redis = 0
+
+    def _contar(self, contador: str, quantidade: int = 1) -> None:
+        with self._lock:
+            setattr(self, contador, getattr(self, contador) + quantidade)
+
+    def _redis_disponivel(self) -> bool:
+        return self._redis is not None and time.monotonic() >= self._redis_pausado_ate
+
+    def _falha_redis(self, e: Exception) -> None:
+        self._contar("erros_redis")
+        self._redis_pausado_ate = time.monotonic() + CACHE_GEO_REDIS_PAUSA_SEGUNDOS
+        logger.warning("Cache de coordenadas: Redis indisponível, usando só a memória: %s", e)
+
+    def _guardar_memoria(self, chave: str, coordenadas: Optional[List[float]], ttl_redis: Optional[float] = None) -> None:
+        if coordenadas is None:
+            ttl = self.ttl_negativo_segundos if ttl_redis is None else ttl_redis
+            self._memoria.definir(chave, _NEGATIVO, ttl_segundos=min(ttl, self.ttl_memoria_segundos))
+        else:
+            self._memoria.definir(chave, coordenadas)
+
+    def obter_varios(self, chaves: Iterable[str]) -> Dict[str, Optional[List[float]]]:
+        """Só as chaves encontradas (None é um resultado vazio recente); uma ida ao Redis para todas."""
+        unicas = list(dict.fromkeys(chaves))
+        encontrados: Dict[str, Optional[List[float]]] = {}
+        faltando = []
+        for chave in unicas:
+            valor = self._memoria.obter(chave)
+            if valor is None:
+                faltando.append(chave)
+                continue
+            self._contar("hits_negativos" if valor is _NEGATIVO else "hits_memoria")
+            encontrados[chave] = None if valor is _NEGATIVO else valor
+
+        if faltando and self._redis_disponivel():
+            try:
+                with self._redis.pipeline() as pipe:
+                    for chave in faltando:
+                        pipe.get(CACHE_GEO_PREFIXO + chave).ttl(CACHE_GEO_PREFIXO + chave)
+                    respostas = pipe.execute()
+            except redis.RedisError as e:
+                self._falha_redis(e)
+                respostas = []
+            for chave, bruto, ttl in zip(faltando, respostas[::2], respostas[1::2]):
+                if bruto is None:
+                    continue
+                coordenadas = json.loads(bruto)
+                self._contar("hits_negativos" if coordenadas is None else "hits_redis")
+                self._guardar_memoria(chave, coordenadas, ttl_redis=ttl if ttl and ttl > 0 else None)
+                encontrados[chave] = coordenadas
+
+        self._contar("misses", len(unicas) - len(encontrados))
+        return encontrados
+
+    def obter(self, chave: str) -> Tuple[bool, Optional[List[float]]]:
+        """(encontrado, coordenadas); encontrado com coordenadas None é um resultado vazio recente."""
+        encontrados = self.obter_varios([chave])
+        return chave in encontrados, encontrados.get(chave)
+
+    def definir_varios(self, coordenadas_por_chave: Dict[str, Optional[List[float]]]) -> None:
+        """Guarda coordenadas, ou None para endereços que o geocodificador não achou."""
+        for chave, coordenadas in coordenadas_por_chave.items():
+            self._guardar_memoria(chave, coordenadas)
+        if not coordenadas_por_chave or not self._redis_disponivel():
+            return
+        try:
+            with self._redis.pipeline() as pipe:
+                for chave, coordenadas in coordenadas_por_chave.items():
+                    ttl = self.ttl_segundos if coordenadas is not None else self.ttl_negativo_segundos
+                    pipe.set(CACHE_GEO_PREFIXO + chave, json.dumps(coordenadas), ex=ttl)
+                pipe.execute()
+        except redis.RedisError as e:
+            self._falha_redis(e)
+
+    def definir(self, chave: str, coordenadas: Optional[List[float]]) -> None:
+        self.definir_varios({chave: coordenadas})
+
+    def remover(self, chave: str) -> None:
+        self._memoria.remover(chave)
+        if self._redis_disponivel():
+            try:
+                self._redis.delete(CACHE_GEO_PREFIXO + chave)
+            except redis.RedisError as e:
+                self._falha_redis(e)
+
+    def estatisticas(self) -> dict:
+        return {
+            "hits_memoria": self.hits_memoria,
+            "hits_redis": self.hits_redis,
+            "hits_negativos": self.hits_negativos,
+            "misses": self.misses,
+            "itens_memoria": len(self._memoria),
+            "despejos_memoria": self._memoria.despejos,
+            "erros_redis": self.erros_redis,
+            "redis": self._redis is not None and self._redis_disponivel(),
+        }
@@ -0,0 +1,160 @@
+import asyncio
+import hashlib
+import json
+import os
+import tempfile
+import time
+from typing import Awaitable, Callable, Dict, Iterable, Optional
+
+from load_files import logger
+from utils.lru import CacheLRU
+
+CACHE_RECIBOS_MAX_ITENS = int(os.getenv("CACHE_RECIBOS_MAX_ITENS", "256"))
+CACHE_RECIBOS_DIR = os.getenv("CACHE_RECIBOS_DIR", os.path.join(tempfile.gettempdir(), "cache_recibos"))
+CACHE_RECIBOS_TTL_SEGUNDOS = int(os.getenv("CACHE_RECIBOS_TTL_SEGUNDOS", str(24 * 3600)))
+CACHE_RECIBOS_MAX_BYTES = int(os.getenv("CACHE_RECIBOS_MAX_BYTES", str(100 * 1024 * 1024)))
+
+
+def chave_recibo(hash_conteudo: str, *variantes: str) -> str:
+    """Chave pelo sha256 do arquivo (calculado no upload) mais as opções que mudam o resultado."""
+    chave = hashlib.sha256(hash_conteudo.encode())
+    for variante in variantes:
+        chave.update(b"|" + variante.encode())
+    return chave.hexdigest()
+
+
+class CacheRecibos:
+    """
+    Cache do resultado do parse_campos em dois níveis: LRU em memória na frente
+    e arquivos JSON em disco com TTL e limite de tamanho.
+    Uploads idênticos simultâneos compartilham o mesmo processamento.
+    """
+
+    def __init__(
+        self,
+        max_itens: int = CACHE_RECIBOS_MAX_ITENS,
+        diretorio: str = CACHE_RECIBOS_DIR,
+        ttl_segundos: int = CACHE_RECIBOS_TTL_SEGUNDOS,
+        max_bytes: int = CACHE_RECIBOS_MAX_BYTES,
+    ):
+        self._memoria = CacheLRU(max_itens, ttl_segundos=ttl_segundos)
+        self.diretorio = diretorio
+        self.ttl_segundos = ttl_segundos
+        self.max_bytes = max_bytes
+        self._bytes_disco: Optional[int] = None
+        self._em_andamento: Dict[str, asyncio.Task] = {}
+
+        self.hits_memoria = 0
+        self.hits_disco = 0
+        self.misses = 0
+        self.compartilhados = 0
+        self.despejos_disco = 0
+
+    def _caminho(self, chave: str) -> str:
+        return os.path.join(self.diretorio, f"{chave}.json")
+
+    def _ler_disco(self, chave: str) -> Optional[dict]:
+        caminho = self._caminho(chave)
+        try:
+            if time.time() - os.path.getmtime(caminho) > self.ttl_segundos:
+                os.remove(caminho)
+                return None
+            with open(caminho, encoding="utf-8") as arquivo:
+                return json.load(arquivo)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning("Cache de recibos: falha ao ler %s: %s", caminho, e)
+            return None
+
+    def _gravar_disco(self, chave: str, valor: dict) -> None:
+        try:
+            os.makedirs(self.diretorio, exist_ok=True)
+            conteudo = json.dumps(valor, ensure_ascii=False).encode("utf-8")
+            temporario = self._caminho(chave) + ".tmp"
+            with open(temporario, "wb") as arquivo:
+                arquivo.write(conteudo)
+            os.replace(temporario, self._caminho(chave))
+
+            if self._bytes_disco is None:
+                self._bytes_disco = self._limpar_disco()
+            else:
+                self._bytes_disco += len(conteudo)
+                if self._bytes_disco > self.max_bytes:
+                    self._bytes_disco = self._limpar_disco()
+        except Exception as e:
+            logger.warning("Cache de recibos: falha ao gravar %s: %s", chave, e)
+
+    def _limpar_disco(self) -> int:
+        """Remove entradas expiradas e as mais antigas até caber no limite."""
+        agora = time.time()
+        entradas = []
+        for entrada in os.scandir(self.diretorio):
+            if not entrada.name.endswith(".json"):
+                continue
+            info = entrada.stat()
+            if agora - info.st_mtime > self.ttl_segundos:
+                os.remove(entrada.path)
+                continue
+            entradas.append((info.st_mtime, info.st_size, entrada.path))
+
+        total = sum(tamanho for _, tamanho, _ in entradas)
+        for _, tamanho, caminho in sorted(entradas):
+            if total <= self.max_bytes:
+                break
+            os.remove(caminho)
+            total -= tamanho
+            self.despejos_disco += 1
+        return total
+
+    async def _resolver(self, chave: str, calcular: Callable[[], Awaitable[dict]]) -> dict:
+        valor = await asyncio.to_thread(self._ler_disco, chave)
+        if valor is not None:
+            self.hits_disco += 1
+        else:
+            self.misses += 1
+            valor = await calcular()
+            await asyncio.to_thread(self._gravar_disco, chave, valor)
+        self._memoria.definir(chave, valor)
+        return valor
+
+    def _finalizar(self, chave: str, tarefa: asyncio.Task) -> None:
+        self._em_andamento.pop(chave, None)
+        if not tarefa.cancelled():
+            # Evita o aviso de exceção não lida quando todos os clientes desistiram
+            tarefa.exception()
+
+    async def obter_ou_calcular(self, chave: str, calcular: Callable[[], Awaitable[dict]]) -> dict:
+        valor = self._memoria.obter(chave)
+        if valor is not None:
+            self.hits_memoria += 1
+            return valor
+
+        tarefa = self._em_andamento.get(chave)
+        if tarefa is None:
+            tarefa = asyncio.create_task(self._resolver(chave, calcular))
+            self._em_andamento[chave] = tarefa
+            tarefa.add_done_callback(lambda t: self._finalizar(chave, t))
+        else:
+            self.compartilhados += 1
+        return await asyncio.shield(tarefa)
+
+    async def aguardar(self, chaves: Iterable[str]) -> None:
+        """Espera as tarefas em andamento dessas chaves, mesmo as que ninguém mais aguarda."""
+        tarefas = [self._em_andamento[chave] for chave in chaves if chave in self._em_andamento]
+        # wait, e não gather: cancelar quem espera não pode cancelar o OCR
+        if tarefas:
+            await asyncio.wait(tarefas)
+
+    def estatisticas(self) -> dict:
+        return {
+            "hits_memoria": self.hits_memoria,
+            "hits_disco": self.hits_disco,
+            "misses": self.misses,
+            "compartilhados": self.compartilhados,
+            "em_andamento": len(self._em_andamento),
+            "itens_memoria": len(self._memoria),
+            "despejos_memoria": self._memoria.despejos,
+            "despejos_disco": self.despejos_disco,
+            "bytes_disco": self._bytes_disco,
+        }
@@ -0,0 +1,76 @@
+import os
+import threading
+from concurrent.futures import Future
+from typing import Callable, Dict, Hashable, TypeVar
+
+import openrouteservice
+from requests.adapters import HTTPAdapter
+
+# Conexões keep-alive por chave de API; cobre as consultas paralelas do resolver_coordenadas
+ORS_POOL_CONEXOES = int(os.getenv("ORS_POOL_CONEXOES", "10"))
+ORS_TIMEOUT = (10, 60)  # 10s para conectar, 60s para resposta
+
+T = TypeVar("T")
+
+_clientes: Dict[str, openrouteservice.Client] = {}
+_lock_clientes = threading.Lock()
+
+
+def obter_cliente(api_key: str) -> openrouteservice.Client:
+    """Um cliente por chave de API no processo, com a sessão HTTP reaproveitada entre chamadas e threads."""
+    with _lock_clientes:
+        cliente = _clientes.get(api_key)
+        if cliente is None:
+            cliente = openrouteservice.Client(
+                key=api_key,
+                retry_over_query_limit=True,
+                timeout=ORS_TIMEOUT,  # type: ignore
+            )
+            adaptador = HTTPAdapter(pool_connections=1, pool_maxsize=ORS_POOL_CONEXOES)
+            cliente._session.mount("https://", adaptador)
+            cliente._session.mount("http://", adaptador)
+            _clientes[api_key] = cliente
+        return cliente
+
+
+def _descartar_clientes() -> None:
+    # Conexões abertas antes do fork não podem ser usadas pelos dois processos
+    _clientes.clear()
+
+
+os.register_at_fork(after_in_child=_descartar_clientes)
+
+
+class ChamadaUnica:
+    """
+    Chamadas simultâneas com a mesma chave compartilham uma única execução:
+    a primeira thread executa e as outras esperam o mesmo resultado (ou erro).
+    """
+
+    def __init__(self):
+        self._em_andamento: Dict[Hashable, Future] = {}
+        self._lock = threading.Lock()
+        self.compartilhadas = 0
+
+    def executar(self, chave: Hashable, funcao: Callable[[], T]) -> T:
+        with self._lock:
+            futuro = self._em_andamento.get(chave)
+            dono = futuro is None
+            if dono:
+                futuro = self._em_andamento[chave] = Future()
+            else:
+                self.compartilhadas += 1
+        if not dono:
+            return futuro.result()
+
+        try:
+            resultado = funcao()
+        except BaseException as e:
+            futuro.set_exception(e)
+            raise
+        else:
+            futuro.set_result(resultado)
+            return resultado
+        finally:
+            with self._lock:
+                self._em_andamento.pop(chave, None)
@@ -0,0 +1,266 @@
+import os
+import threading
+import time
+import unicodedata
+from typing import Dict, Iterable, List, Optional, Set
+
+from load_files import logger, supabase
+
+# Aproxima sabores, rua e bairro lidos pelo OCR dos valores já cadastrados
+CORRECAO_OCR = os.getenv("CORRECAO_OCR", "1") == "1"
+CORRECAO_OCR_DISTANCIA_MAXIMA = int(os.getenv("CORRECAO_OCR_DISTANCIA_MAXIMA", "2"))
+CORRECAO_OCR_TTL_SEGUNDOS = int(os.getenv("CORRECAO_OCR_TTL_SEGUNDOS", "900"))
+# Só o começo e o fim do termo entram no índice de deleções; a distância final usa o termo inteiro
+CORRECAO_OCR_PONTAS = 10
+# O PostgREST devolve no máximo 1000 linhas por resposta
+CORRECAO_OCR_PAGINA = 1000
+
+
+def normalizar_termo(texto: str) -> str:
+    """Maiúsculas, sem acentos e com espaços simples: erros de acento não contam como edição."""
+    sem_acento = unicodedata.normalize("NFD", texto.upper())
+    return " ".join("".join(c for c in sem_acento if not unicodedata.combining(c)).split())
+
+
+def _distancia(a: str, b: str, limite: int) -> int:
+    """Levenshtein restrito à faixa diagonal; devolve limite + 1 assim que passar do limite."""
+    if abs(len(a) - len(b)) > limite:
+        return limite + 1
+    anterior = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        inicio, fim = max(1, i - limite), min(len(b), i + limite)
+        atual = [limite + 1] * (len(b) + 1)
+        if inicio == 1:
+            atual[0] = i
+        menor = atual[0]
+        for j in range(inicio, fim + 1):
+            custo = 0 if ca == b[j - 1] else 1
+            atual[j] = min(anterior[j] + 1, atual[j - 1] + 1, anterior[j - 1] + custo)
+            if atual[j] < menor:
+                menor = atual[j]
+        if menor > limite:
+            return limite + 1
+        anterior = atual
+    return anterior[len(b)]
+
+
+def _edicoes_plausiveis(lido: str, termo: str) -> bool:
+    """
+    O OCR erra uma ou outra letra por palavra; duas trocas numa palavra curta
+    ("JOAO" -> "JOSE") já são outro nome. Palavras grudadas ou separadas pelo OCR
+    não têm como ser alinhadas e passam.
+    """
+    palavras_lidas, palavras_termo = lido.split(), termo.split()
+    if len(palavras_lidas) != len(palavras_termo):
+        return True
+    for a, b in zip(palavras_lidas, palavras_termo):
+        limite = max(1, len(b) // 4)
+        if _distancia(a, b, limite) > limite:
+            return False
+    return True
+
+
+class IndiceCorrecao:
+    """
+    Índice de deleções simétricas (estilo SymSpell): o começo e o fim de cada termo
+    são guardados junto com as suas variações com até `max_distancia` letras a menos.
+    A busca só compara o termo lido com os candidatos que compartilham uma variação
+    do começo e uma do fim; ruas como "RUA JOSE ..." têm começos parecidos demais
+    para filtrar só pelo prefixo.
+    """
+
+    def __init__(self, max_distancia: int = CORRECAO_OCR_DISTANCIA_MAXIMA, pontas: int = CORRECAO_OCR_PONTAS):
+        self.max_distancia = max_distancia
+        self.pontas = pontas
+        self._termos: Dict[str, str] = {}
+        self._inicios: Dict[str, Set[str]] = {}
+        self._fins: Dict[str, Set[str]] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _variacoes(ponta: str, distancia: int) -> Set[str]:
+        variacoes = {ponta}
+        fronteira = set(variacoes)
+        for _ in range(distancia):
+            fronteira = {v[:i] + v[i + 1:] for v in fronteira for i in range(len(v))}
+            variacoes |= fronteira
+        return variacoes
+
+    def _distancia_permitida(self, chave: str) -> int:
+        # Palavras curtas viram outras palavras com uma ou duas trocas
+        return min(self.max_distancia, len(chave) // 4)
+
+    def _pontas(self, chave: str):
+        return ((self._inicios, chave[:self.pontas]), (self._fins, chave[-self.pontas:]))
+
+    def _adicionar(self, chave: str, termo: str) -> None:
+        if chave not in self._termos:
+            for delecoes, ponta in self._pontas(chave):
+                for variacao in self._variacoes(ponta, self.max_distancia):
+                    delecoes.setdefault(variacao, set()).add(chave)
+        self._termos[chave] = termo
+
+    def _remover(self, chave: str) -> None:
+        if self._termos.pop(chave, None) is None:
+            return
+        for delecoes, ponta in self._pontas(chave):
+            for variacao in self._variacoes(ponta, self.max_distancia):
+                chaves = delecoes.get(variacao)
+                if chaves is not None:
+                    chaves.discard(chave)
+                    if not chaves:
+                        del delecoes[variacao]
+
+    def _candidatos(self, chave: str, distancia: int) -> Set[str]:
+        por_ponta = []
+        for delecoes, ponta in self._pontas(chave):
+            candidatos: Set[str] = set()
+            for variacao in self._variacoes(ponta, distancia):
+                candidatos.update(delecoes.get(variacao, ()))
+            por_ponta.append(candidatos)
+        return por_ponta[0] & por_ponta[1]
+
+    def adicionar(self, termo: str) -> None:
+        chave = normalizar_termo(termo)
+        if chave:
+            with self._lock:
+                self._adicionar(chave, termo)
+
+    def sincronizar(self, termos: Iterable[str]) -> None:
+        """Atualiza o índice para o conjunto `termos` mexendo só no que mudou."""
+        novos = {normalizar_termo(termo): termo for termo in termos if termo and termo.strip()}
+        novos.pop("", None)
+        with self._lock:
+            for chave in set(self._termos) - set(novos):
+                self._remover(chave)
+            for chave, termo in novos.items():
+                self._adicionar(chave, termo)
+
+    def corrigir(self, texto: str) -> Optional[str]:
+        """Termo cadastrado dentro do limite de edições, ou None se não houver exatamente um."""
+        chave = normalizar_termo(texto)
+        if not chave:
+            return None
+        with self._lock:
+            if chave in self._termos:
+                return self._termos[chave]
+            distancia = self._distancia_permitida(chave)
+            if distancia == 0:
+                return None
+            candidatos = self._candidatos(chave, distancia)
+
+            # Dois termos ao alcance (ex.: "RUA SAO JOSE" e "RUA SAO JOAO") tornam a troca um chute
+            proximos = [c for c in candidatos if _distancia(chave, c, distancia) <= distancia]
+            if len(proximos) != 1 or not _edicoes_plausiveis(chave, proximos[0]):
+                return None
+            return self._termos[proximos[0]]
+
+    def __len__(self) -> int:
+        return len(self._termos)
+
+
+class _Indices:
+    def __init__(self):
+        self.sabores = IndiceCorrecao()
+        self.ruas = IndiceCorrecao()
+        self.bairros = IndiceCorrecao()
+        self.carregado_em: Optional[float] = None
+        self.atualizando = False
+        self.lock = threading.Lock()
+
+
+_indices = _Indices()
+
+
+def definir_indices(sabores: Iterable[str], ruas: Iterable[str], bairros: Iterable[str]) -> None:
+    """Sincroniza os índices com as listas dadas (também usado para rodar sem Supabase)."""
+    _indices.sabores.sincronizar(sabores)
+    _indices.ruas.sincronizar(ruas)
+    _indices.bairros.sincronizar(bairros)
+    with _indices.lock:
+        _indices.carregado_em = time.monotonic()
+        _indices.atualizando = False
+
+
+def _ler_tabela(tabela: str, colunas: str) -> List[Dict]:
+    """Todas as linhas da tabela, em páginas de CORRECAO_OCR_PAGINA."""
+    linhas: List[Dict] = []
+    inicio = 0
+    while True:
+        pagina = supabase.table(tabela).select(colunas) \
+            .order("id") \
+            .range(inicio, inicio + CORRECAO_OCR_PAGINA - 1) \
+            .execute().data or []
+        linhas.extend(pagina)
+        if len(pagina) < CORRECAO_OCR_PAGINA:
+            return linhas
+        inicio += CORRECAO_OCR_PAGINA
+
+
+def carregar_indices() -> None:
+    """Sincroniza os índices com os produtos e endereços cadastrados no Supabase."""
+    try:
+        produtos = _ler_tabela("products", "name")
+        enderecos = _ler_tabela("address", "street, district")
+        # Uma linha por endereço: só os nomes distintos vão para o índice
+        definir_indices(
+            {p.get("name") or "" for p in produtos},
+            {e.get("street") or "" for e in enderecos},
+            {e.get("district") or "" for e in enderecos},
+        )
+    except Exception as e:
+        logger.warning("Falha ao carregar índices de correção do OCR: %s", e)
+        # Tenta de novo só depois do TTL
+        with _indices.lock:
+            _indices.carregado_em = time.monotonic()
+            _indices.atualizando = False
+
+
+def _garantir_indices() -> None:
+    with _indices.lock:
+        carregado_em = _indices.carregado_em
+        expirado = carregado_em is not None and time.monotonic() - carregado_em > CORRECAO_OCR_TTL_SEGUNDOS
+        if expirado and not _indices.atualizando:
+            _indices.atualizando = True
+            threading.Thread(target=carregar_indices, daemon=True).start()
+    if carregado_em is None:
+        carregar_indices()
+
+
+def adicionar_endereco(rua: str, bairro: Optional[str]) -> None:
+    """Inclui um endereço recém-cadastrado sem esperar a próxima sincronização."""
+    _indices.ruas.adicionar(rua)
+    if bairro:
+        _indices.bairros.adicionar(bairro)
+
+
+def _no_mesmo_formato(original: str, corrigido: str) -> str:
+    if original.isupper():
+        return corrigido.upper()
+    if original.istitle():
+        return corrigido.title()
+    return corrigido
+
+
+def _corrigir(indice: IndiceCorrecao, valor: Optional[str]) -> Optional[str]:
+    if not valor:
+        return valor
+    corrigido = indice.corrigir(valor)
+    return _no_mesmo_formato(valor, corrigido) if corrigido else valor
+
+
+def corrigir_campos(resultado: Dict) -> Dict:
+    """Troca sabores, rua e bairro do parse_campos pelos valores cadastrados mais próximos."""
+    if not CORRECAO_OCR:
+        return resultado
+    _garantir_indices()
+
+    for item in resultado.get("items") or []:
+        sabores: List[str] = item.get("sabores") or []
+        item["sabores"] = [_corrigir(_indices.sabores, sabor) for sabor in sabores]
+
+    endereco = resultado.get("endereco")
+    if endereco is not None:
+        endereco.rua = _corrigir(_indices.ruas, endereco.rua)
+        endereco.bairro = _corrigir(_indices.bairros, endereco.bairro)
+    return resultado
@@ -1,46 +1,71 @@
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, Iterable, List, Optional
 
-from typing import List, Optional
-
-import openrouteservice
-from load_files import supabase
+from load_files import logger, supabase
 from models import RoterizacaoInput
-import traceback
+from utils import geocoder_local
+from utils.cache_geo import CacheGeo
+from utils.cliente_ors import ChamadaUnica, obter_cliente
+from utils.correcao_ocr import adicionar_endereco
+from utils.logs import amostrado
+from utils.normalizacao_endereco import (
+    CIDADE_PADRAO,
+    ESTADO_PADRAO,
+    PREPOSICOES,
+    TIPOS_LOGRADOURO,
+    TITULOS,
+    EnderecoNormalizado,
+    normalizar_endereco,
+)
+
+# Consultas simultâneas ao Pelias ao resolver um lote de endereços
+GEO_CONCORRENCIA_MAXIMA = int(os.getenv("GEO_CONCORRENCIA_MAXIMA", "4"))
+# O PostgREST devolve no máximo 1000 linhas por resposta
+GEO_SUPABASE_PAGINA = 1000
+# Processos diferentes podem geocodificar o mesmo endereço ao mesmo tempo; o upsert depende de
+# CREATE UNIQUE INDEX address_componentes_key ON address (street, number, district, city, state);
+GEO_CONFLITO_ENDERECO = "street,number,district,city,state"
+
+_pelias_em_andamento = ChamadaUnica()
+
+
+def _pelias_search(normalizado: EnderecoNormalizado, api_key: str) -> dict:
+    logger.debug("Consultando coordenadas no Pelias (bairro=%s)", normalizado.bairro, extra=amostrado())
+    return obter_cliente(api_key).pelias_search(text=normalizado.texto()) # type: ignore
+
+
+def _consultar_pelias(endereco: str, api_key: str) -> Optional[List[float]]:
+    """Coordenadas [longitude, latitude] ou None se o Pelias não achou; erros de rede propagam."""
+    if not isinstance(endereco, str):
+        raise ValueError(f"O parâmetro 'endereco' deve ser uma string, mas recebeu: {type(endereco)}")
+    if not endereco:
+        raise ValueError("O parâmetro 'endereco' não pode ser vazio.")
+    # Abreviações expandidas e cidade/UF padrão quando faltarem
+    normalizado = normalizar_endereco(endereco)
+    # Pedidos simultâneos do mesmo endereço esperam a mesma consulta
+    response = _pelias_em_andamento.executar(
+        (api_key, normalizado.chave), lambda: _pelias_search(normalizado, api_key)
+    )
+    if response and "features" in response and len(response["features"]) > 0:
+        coords = response["features"][0]["geometry"]["coordinates"]
+        return coords  # Retorna [longitude, latitude]
+
+    logger.warning("Nenhuma coordenada encontrada no Pelias (bairro=%s)", normalizado.bairro)
+    return None
+
 
 def get_coordenadas(endereco: str, api_key: str) -> Optional[List[float]]:
     try:
-        if not isinstance(endereco, str):
-            raise ValueError(f"O parâmetro 'endereco' deve ser uma string, mas recebeu: {type(endereco)} - {endereco}")
-        if not endereco:
-            raise ValueError("O parâmetro 'endereco' não pode ser vazio.")
-        # Dividir o endereço em partes
-        partes = endereco.split(',')
-        print(f"Partes do endereço: {partes}")
-        print(f"Endereço original: {endereco}")
-        street = partes[0].strip() if len(partes) > 0 else ""
-        number = partes[1].strip() if len(partes) > 1 else "S/N"  # Valor padrão "S/N" para sem número
-        district = partes[2].strip() if len(partes) > 2 else ""  # Valor padrão vazio para distrito
-
-        # Construir o endereço completo para consulta
-        endereco_completo = f"{street}, {number}, {district}, Jardinópolis, SP"
-        print(f"Consultando coordenadas para: {endereco_completo}")
-        client = openrouteservice.Client(
-            key=api_key,
-            retry_over_query_limit=True,
-            timeout=(10, 60)  # 10s para conectar, 60s para resposta # type: ignore
-        )  # Certifique-se de que data.api_key é válido
-        # Fazer a consulta de coordenadas
-        response = client.pelias_search(text=endereco_completo) # type: ignore
-        print(response)
-        if response and "features" in response and len(response["features"]) > 0:
-            coords = response["features"][0]["geometry"]["coordinates"]
-            return coords  # Retorna [longitude, latitude]
-
-        print(f"⚠️ Nenhuma coordenada encontrada para o endereço: {endereco_completo}")
-        return None
+        # Ruas já conhecidas são respondidas sem chamar o Pelias
+        coordenadas = geocoder_local.localizar(normalizar_endereco(endereco))
+        if coordenadas:
+            return coordenadas
+        return _consultar_pelias(endereco, api_key)
     except Exception as e:
-        print(f"Erro ao obter coordenadas para o endereço '{endereco}': {e}")
-        print(traceback.format_exc())
-        # Exibir o stack trace completo para depuração
+        # Sem o endereço nem a resposta completa: são dados do cliente
+        logger.error("Erro ao obter coordenadas: %s: %s", type(e).__name__, e, exc_info=logger.isEnabledFor(logging.DEBUG))
         return None
 
 
@@ -54,86 +79,151 @@ def calcular_prioridade_por_tempo(tempo_espera_segundos: int, tempo_limite_segun
     prioridade = int(proporcao * (escala - 1)) + 1  # Converte para escala de 1 a 9
     return prioridade
 
-coordenadas_cache = {}
+cache_geo = CacheGeo()
+
+def _padrao_rua(normalizado: EnderecoNormalizado) -> str:
+    """
+    Padrão ilike com as palavras do nome da rua, sem o tipo, títulos e preposições
+    (gravados abreviados ou não); letras acentuadas viram "_" para casar com ou sem acento.
+    """
+    palavras = normalizado.rua.split()
+    if palavras and palavras[0] in TIPOS_LOGRADOURO.values():
+        palavras = palavras[1:]
+    nucleo = [
+        "".join(c if c.isascii() and c.isalnum() else "_" for c in palavra)
+        for palavra in palavras
+        if palavra not in TITULOS.values() and palavra.upper() not in PREPOSICOES
+    ]
+    return "*" + "*".join(nucleo) + "*" if nucleo else "*"
+
+
+def _buscar_coordenadas_supabase_em_lote(
+    normalizados: Dict[str, EnderecoNormalizado]
+) -> Dict[str, List[float]]:
+    """
+    Uma consulta pelos números e pelos nomes das ruas, paginada; a rua e o bairro
+    são conferidos pela chave canônica, então linhas gravadas como "r. rui barbosa"
+    também servem.
+    """
+    if not normalizados:
+        return {}
+    numeros = sorted({n.numero_banco for n in normalizados.values()})
+    ruas = ",".join(sorted({f"street.ilike.{_padrao_rua(n)}" for n in normalizados.values()}))
+    encontrados = {}
+    inicio = 0
+    while True:
+        pagina = supabase.table("address") \
+            .select("street, number, district, city, state, latitude, longitude") \
+            .in_("number", numeros) \
+            .or_(ruas) \
+            .order("id") \
+            .range(inicio, inicio + GEO_SUPABASE_PAGINA - 1) \
+            .execute().data or []
+        for registro in pagina:
+            chave = normalizar_endereco(texto_endereco(registro)).chave
+            if chave in normalizados and chave not in encontrados and registro["latitude"] is not None:
+                encontrados[chave] = [registro["longitude"], registro["latitude"]]
+        if len(pagina) < GEO_SUPABASE_PAGINA or len(encontrados) == len(normalizados):
+            break
+        inicio += GEO_SUPABASE_PAGINA
+    return encontrados
+
 
 def buscar_coordenadas_supabase_por_componentes(endereco: str):
     try:
-        partes = endereco.split(',')
-        street = partes[0].strip().lower() if len(partes) > 0 else None
-        number = partes[1].strip() if len(partes) > 1 else None
-        district = partes[2].strip().lower() if len(partes) > 2 else None
-        city = "Jardinópolis"
-        state = "SP"
-
-        print(f"[Supabase] Buscando coordenadas para street='{street}', number='{number}', district='{district}', city='{city}', state='{state}'")
-
-        response = supabase.table("address") \
-            .select("latitude, longitude") \
-            .eq("street", street) \
-            .eq("number", int(number) if number is not None and number.isdigit() else 0) \
-            .eq("district", district) \
-            .eq("city", city) \
-            .eq("state", state) \
-            .execute()
-
-        if not response:
-            print("[Supabase] Resposta vazia da consulta")
-            return None
-
-        # Não tem data
-        if response and hasattr(response, "data"):
-            if response.data and len(response.data) > 0:
-                coordenadas = response.data[0]
-                print(f"[Supabase] Coordenadas encontradas: {coordenadas}")
-                return [coordenadas["longitude"], coordenadas["latitude"]]
-            else:
-                print("[Supabase] Nenhum registro encontrado")
-        else:
-            if len(response) > 0: # type: ignore
-                coordenadas = response[0] # type: ignore
-                print(f"[Supabase] Coordenadas encontradas: {coordenadas}")
-                return [coordenadas["longitude"], coordenadas["latitude"]]
-            print(f"[Supabase] Resposta inesperada: {response}")
-        return None
+        normalizado = normalizar_endereco(endereco)
+        logger.debug("[Supabase] Buscando coordenadas (bairro=%s)", normalizado.bairro, extra=amostrado())
+        return _buscar_coordenadas_supabase_em_lote({normalizado.chave: normalizado}).get(normalizado.chave)
     except Exception as e:
-        print(f"[Supabase] Erro ao consultar coordenadas: {e}")
-        import traceback
-        print(traceback.format_exc())
+        logger.error("[Supabase] Erro ao consultar coordenadas: %s", e, exc_info=logger.isEnabledFor(logging.DEBUG))
         return None
 
 
+def texto_endereco(registro: dict) -> str:
+    """Texto de geocodificação de uma linha da tabela address."""
+    cidade = registro.get("city") or CIDADE_PADRAO
+    estado = registro.get("state") or ESTADO_PADRAO
+    return f"{registro['street']}, {registro['number']}, {registro['district'] or ''}, {cidade}, {estado}"
+
+
+def _geocodificar_em_paralelo(enderecos: List[str], api_key: str) -> Dict[str, Optional[List[float]]]:
+    """Pelias com no máximo GEO_CONCORRENCIA_MAXIMA consultas ao mesmo tempo; erros ficam de fora."""
+    resultados: Dict[str, Optional[List[float]]] = {}
+    with ThreadPoolExecutor(max_workers=max(1, min(GEO_CONCORRENCIA_MAXIMA, len(enderecos)))) as executor:
+        futuros = {executor.submit(_consultar_pelias, endereco, api_key): endereco for endereco in enderecos}
+        for futuro in as_completed(futuros):
+            try:
+                resultados[futuros[futuro]] = futuro.result()
+            except Exception as e:
+                logger.error("Erro ao obter coordenadas: %s: %s", type(e).__name__, e, exc_info=logger.isEnabledFor(logging.DEBUG))
+    return resultados
+
+
+def resolver_coordenadas(enderecos: Iterable[str], api_key: str) -> Dict[str, Optional[List[float]]]:
+    """
+    Coordenadas [longitude, latitude] de vários endereços de uma vez, pela chave
+    canônica de normalizar_endereco: cache, uma consulta na tabela address para os
+    que faltarem, interpolação nas ruas conhecidas (geocoder_local), o Pelias em
+    paralelo para o resto e um único insert com os novos. Endereços sem
+    coordenadas ficam com None.
+    """
+    unicos = list(dict.fromkeys(endereco for endereco in enderecos if endereco))
+    # Grafias diferentes do mesmo lugar dividem a chave, o cache e a consulta ao Pelias
+    normalizados = {endereco: normalizar_endereco(endereco) for endereco in unicos}
+    representantes = {n.chave: endereco for endereco, n in reversed(normalizados.items())}
+    por_chave = {chave: normalizados[endereco] for chave, endereco in representantes.items()}
+
+    por_chave_resultado = cache_geo.obter_varios(por_chave)
+    faltando = {chave: n for chave, n in por_chave.items() if chave not in por_chave_resultado}
+    if faltando:
+        # Busca no banco usando colunas separadas
+        try:
+            do_banco = _buscar_coordenadas_supabase_em_lote(faltando)
+        except Exception as e:
+            logger.error("[Supabase] Erro ao consultar coordenadas: %s", e, exc_info=logger.isEnabledFor(logging.DEBUG))
+            do_banco = {}
+        # Números novos em ruas conhecidas são interpolados localmente, sem gravar no banco
+        locais = {}
+        for chave, normalizado in faltando.items():
+            if chave not in do_banco:
+                coordenadas = geocoder_local.localizar(normalizado)
+                if coordenadas:
+                    locais[chave] = coordenadas
+        cache_geo.definir_varios({**do_banco, **locais})
+        por_chave_resultado.update(do_banco)
+        por_chave_resultado.update(locais)
+
+        # Se não encontrado, chama a API; falhas de rede não entram no cache negativo
+        geocodificados = _geocodificar_em_paralelo(
+            [representantes[chave] for chave in faltando if chave not in por_chave_resultado], api_key
+        )
+        geocodificados = {normalizados[endereco].chave: c for endereco, c in geocodificados.items()}
+        novos = {chave: c for chave, c in geocodificados.items() if c}
+        if novos:
+            # Salva no banco com os componentes, não só a string; quem gravou primeiro fica
+            try:
+                supabase.table("address").upsert([
+                    {
+                        "street": por_chave[chave].rua,
+                        "number": por_chave[chave].numero_banco,
+                        "district": por_chave[chave].bairro,
+                        "city": por_chave[chave].cidade,
+                        "state": por_chave[chave].estado,
+                        "latitude": coordenadas[1],
+                        "longitude": coordenadas[0],
+                    }
+                    for chave, coordenadas in novos.items()
+                ], on_conflict=GEO_CONFLITO_ENDERECO, ignore_duplicates=True).execute()
+                for chave, coordenadas in novos.items():
+                    adicionar_endereco(por_chave[chave].rua, por_chave[chave].bairro)
+                    geocoder_local.adicionar_geocodificado(por_chave[chave], coordenadas)
+            except Exception as e:
+                logger.error("[Supabase] Erro ao gravar %d endereços: %s", len(novos), e)
+        cache_geo.definir_varios(geocodificados)
+        por_chave_resultado.update(geocodificados)
+
+    return {endereco: por_chave_resultado.get(n.chave) for endereco, n in normalizados.items()}
+
 
 def get_coordenadas_com_cache(endereco: str, api_key: str) -> Optional[List[float]]:
-    if endereco in coordenadas_cache:
-        return coordenadas_cache[endereco]
-
-    # Busca no banco usando colunas separadas
-    coordenadas = buscar_coordenadas_supabase_por_componentes(endereco)
-    if coordenadas:
-        coordenadas_cache[endereco] = coordenadas
-        return coordenadas
-
-    # Se não encontrado, chama a API
-    coordenadas = get_coordenadas(endereco, api_key=api_key)
-
-    # Se a API respondeu, salva no banco (precisa salvar com os componentes, não só string)
-    if coordenadas:
-        partes = endereco.split(',')
-        street = partes[0].strip().lower() if len(partes) > 0 else ""
-        number = partes[1].strip() if len(partes) > 1 else "S/N"
-        district = partes[2].strip().lower() if len(partes) > 2 else ""
-        city = "Jardinópolis"
-        state = "SP"
-
-        supabase.table("address").insert({
-            "street": street,
-            "number": int(number) if number.isdigit() else 0,
-            "district": district,
-            "city": city,
-            "state": state,
-            "latitude": coordenadas[1],
-            "longitude": coordenadas[0]
-        }).execute()
-
-    coordenadas_cache[endereco] = coordenadas
-    return coordenadas
+    return resolver_coordenadas([endereco], api_key).get(endereco)
@@ -0,0 +1,182 @@
+import bisect
+import math
+import os
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from load_files import logger, supabase
+from utils.normalizacao_endereco import EnderecoNormalizado, normalizar_endereco
+
+# Geocodifica pelas ruas que já estão na tabela address, sem chamar o Pelias
+GEOCODER_LOCAL = os.getenv("GEOCODER_LOCAL", "1") == "1"
+GEOCODER_LOCAL_TTL_SEGUNDOS = int(os.getenv("GEOCODER_LOCAL_TTL_SEGUNDOS", "1800"))
+# Quantos números além do primeiro/último conhecido da rua ainda dá para estimar
+GEOCODER_LOCAL_EXTRAPOLACAO_MAXIMA = int(os.getenv("GEOCODER_LOCAL_EXTRAPOLACAO_MAXIMA", "100"))
+# Trechos mais longos que isso entre dois números conhecidos não são interpolados
+# (ruas com o mesmo nome em pontos diferentes, curvas)
+GEOCODER_LOCAL_TRECHO_MAXIMO_METROS = int(os.getenv("GEOCODER_LOCAL_TRECHO_MAXIMO_METROS", "1000"))
+GEOCODER_LOCAL_PAGINA = 1000
+METROS_POR_GRAU = 111_320
+
+Ponto = Tuple[int, float, float]  # (número, longitude, latitude)
+
+
+def _metros(lon_a: float, lat_a: float, lon_b: float, lat_b: float) -> float:
+    """Distância equirretangular; basta dentro de uma cidade."""
+    x = (lon_b - lon_a) * math.cos(math.radians((lat_a + lat_b) / 2))
+    return math.hypot(x, lat_b - lat_a) * METROS_POR_GRAU
+
+
+def _entre(a: Ponto, b: Ponto, numero: int) -> Optional[List[float]]:
+    if _metros(a[1], a[2], b[1], b[2]) > GEOCODER_LOCAL_TRECHO_MAXIMO_METROS:
+        return None
+    fracao = (numero - a[0]) / (b[0] - a[0])
+    return [a[1] + (b[1] - a[1]) * fracao, a[2] + (b[2] - a[2]) * fracao]
+
+
+def _interpolar(pontos: List[Ponto], numero: int) -> Optional[List[float]]:
+    """Interpola (ou extrapola um pouco) ao longo dos números conhecidos, em ordem."""
+    numeros = [p[0] for p in pontos]
+    i = bisect.bisect_left(numeros, numero)
+    if i < len(pontos) and numeros[i] == numero:
+        return [pontos[i][1], pontos[i][2]]
+    if len(pontos) < 2:
+        return None
+    if 0 < i < len(pontos):
+        return _entre(pontos[i - 1], pontos[i], numero)
+    # Antes do primeiro ou depois do último: usa o trecho da ponta
+    a, b = (pontos[0], pontos[1]) if i == 0 else (pontos[-2], pontos[-1])
+    ponta = a if i == 0 else b
+    if abs(numero - ponta[0]) > GEOCODER_LOCAL_EXTRAPOLACAO_MAXIMA:
+        return None
+    return _entre(a, b, numero)
+
+
+class GeocoderLocal:
+    """
+    Números conhecidos de cada rua, em ordem, para interpolar a posição de um
+    número novo; os dois lados da rua (pares e ímpares) são interpolados à parte
+    quando houver pontos suficientes.
+    """
+
+    def __init__(self):
+        self._ruas: Dict[str, List[Ponto]] = {}
+        self._lock = threading.Lock()
+
+    def sincronizar(self, registros: Iterable[Tuple[EnderecoNormalizado, List[float]]]) -> None:
+        """Reconstrói o índice a partir de (endereço, [longitude, latitude])."""
+        acumulado: Dict[str, Dict[int, List[float]]] = {}
+        for normalizado, (lon, lat) in registros:
+            if not normalizado.numero_banco:
+                continue
+            numeros = acumulado.setdefault(normalizado.chave_rua, {})
+            soma = numeros.setdefault(normalizado.numero_banco, [0.0, 0.0, 0])
+            soma[0] += lon
+            soma[1] += lat
+            soma[2] += 1
+
+        # Números repetidos viram a média das coordenadas gravadas
+        ruas = {
+            chave: sorted((numero, s[0] / s[2], s[1] / s[2]) for numero, s in numeros.items())
+            for chave, numeros in acumulado.items()
+        }
+        with self._lock:
+            self._ruas = ruas
+
+    def adicionar(self, normalizado: EnderecoNormalizado, coordenadas: List[float]) -> None:
+        """Inclui um endereço recém-geocodificado na interpolação, sem esperar a sincronização."""
+        if not normalizado.numero_banco:
+            return
+        ponto = (normalizado.numero_banco, coordenadas[0], coordenadas[1])
+        with self._lock:
+            pontos = list(self._ruas.get(normalizado.chave_rua, []))
+            numeros = [p[0] for p in pontos]
+            i = bisect.bisect_left(numeros, ponto[0])
+            if i < len(pontos) and numeros[i] == ponto[0]:
+                return
+            pontos.insert(i, ponto)
+            self._ruas[normalizado.chave_rua] = pontos
+
+    def localizar(self, normalizado: EnderecoNormalizado) -> Optional[List[float]]:
+        """[longitude, latitude] estimada, ou None se a rua ou o número não dão base suficiente."""
+        numero = normalizado.numero_banco
+        if not numero:
+            return None
+        with self._lock:
+            pontos = self._ruas.get(normalizado.chave_rua)
+        if not pontos:
+            return None
+        mesmo_lado = [p for p in pontos if p[0] % 2 == numero % 2]
+        if len(mesmo_lado) >= 2:
+            coordenadas = _interpolar(mesmo_lado, numero)
+            if coordenadas:
+                return coordenadas
+        return _interpolar(pontos, numero)
+
+    def __len__(self) -> int:
+        return sum(len(pontos) for pontos in self._ruas.values())
+
+
+class _Estado:
+    def __init__(self):
+        self.geocoder = GeocoderLocal()
+        self.carregado_em: Optional[float] = None
+        self.atualizando = False
+        self.lock = threading.Lock()
+
+
+_estado = _Estado()
+
+
+def carregar_geocoder_local() -> None:
+    """Monta o índice com todos os endereços já geocodificados da tabela address."""
+    try:
+        registros = []
+        inicio = 0
+        while True:
+            pagina = supabase.table("address") \
+                .select("street, number, district, city, state, latitude, longitude") \
+                .not_.is_("latitude", "null") \
+                .range(inicio, inicio + GEOCODER_LOCAL_PAGINA - 1) \
+                .execute().data or []
+            for r in pagina:
+                if r.get("latitude") is None or r.get("longitude") is None:
+                    continue
+                texto = f"{r['street']}, {r['number']}, {r.get('district') or ''}, {r.get('city') or ''}, {r.get('state') or ''}"
+                registros.append((normalizar_endereco(texto), [r["longitude"], r["latitude"]]))
+            if len(pagina) < GEOCODER_LOCAL_PAGINA:
+                break
+            inicio += GEOCODER_LOCAL_PAGINA
+        _estado.geocoder.sincronizar(registros)
+        logger.info("Geocodificador local carregado com %d endereços", len(_estado.geocoder))
+    except Exception as e:
+        logger.warning("Falha ao carregar o geocodificador local: %s", e)
+    # Em caso de falha, tenta de novo só depois do TTL
+    with _estado.lock:
+        _estado.carregado_em = time.monotonic()
+        _estado.atualizando = False
+
+
+def _garantir_geocoder() -> None:
+    with _estado.lock:
+        carregado_em = _estado.carregado_em
+        expirado = carregado_em is not None and time.monotonic() - carregado_em > GEOCODER_LOCAL_TTL_SEGUNDOS
+        if expirado and not _estado.atualizando:
+            _estado.atualizando = True
+            threading.Thread(target=carregar_geocoder_local, daemon=True).start()
+    if carregado_em is None:
+        carregar_geocoder_local()
+
+
+def localizar(normalizado: EnderecoNormalizado) -> Optional[List[float]]:
+    """[longitude, latitude] pelas ruas conhecidas, ou None para cair no Pelias."""
+    if not GEOCODER_LOCAL:
+        return None
+    _garantir_geocoder()
+    return _estado.geocoder.localizar(normalizado)
+
+
+def adicionar_geocodificado(normalizado: EnderecoNormalizado, coordenadas: List[float]) -> None:
+    _estado.geocoder.adicionar(normalizado, coordenadas)
+
@@ -0,0 +1,109 @@
+import atexit
+import copy
+import logging
+import logging.handlers
+import os
+import queue
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar, Token
+from typing import Dict, Iterator, Optional
+
+# A escrita no arquivo roda numa thread própria; quem loga só coloca o registro na fila
+LOG_ARQUIVO = os.getenv("LOG_ARQUIVO", "api_logs.txt")
+LOG_NIVEL = os.getenv("LOG_NIVEL", "INFO").upper()
+# Fração das mensagens por item (linha, endereço, produto) que chega ao arquivo
+LOG_AMOSTRAGEM_ITENS = float(os.getenv("LOG_AMOSTRAGEM_ITENS", "0.01"))
+LOG_FORMATO = "%(asctime)s - %(levelname)s - %(message)s%(contexto)s"
+
+_contexto: ContextVar[Dict[str, object]] = ContextVar("contexto_log", default={})
+
+
+def entrar_contexto(**campos) -> Token:
+    """Acrescenta campos (id_pedido, task_id, etapa...) aos logs seguintes; desfaça com sair_contexto."""
+    return _contexto.set({**_contexto.get(), **{k: v for k, v in campos.items() if v is not None}})
+
+
+def sair_contexto(token: Token) -> None:
+    _contexto.reset(token)
+
+
+@contextmanager
+def contexto_log(**campos) -> Iterator[None]:
+    """Os campos valem para todo log emitido dentro do bloco."""
+    token = entrar_contexto(**campos)
+    try:
+        yield
+    finally:
+        sair_contexto(token)
+
+
+def amostrado(taxa: Optional[float] = None) -> Dict[str, float]:
+    """`extra` para mensagens por item: só uma fração delas é gravada."""
+    return {"amostragem": LOG_AMOSTRAGEM_ITENS if taxa is None else taxa}
+
+
+class FiltroContexto(logging.Filter):
+    """Aplica a amostragem e anexa os campos do contexto; roda na thread de quem loga."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        taxa = getattr(record, "amostragem", None)
+        if taxa is not None and random.random() >= taxa:
+            return False
+        campos = _contexto.get()
+        record.contexto = (" | " + " ".join(f"{k}={v}" for k, v in campos.items())) if campos else ""
+        return True
+
+
+class _ManipuladorFila(logging.handlers.QueueHandler):
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Resolve só a mensagem, para os argumentos não mudarem até a gravação;
+        # data, formato e traceback ficam para a thread do listener
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+class _Logs:
+    def __init__(self):
+        self.manipulador_fila: Optional[_ManipuladorFila] = None
+        self.manipulador_arquivo: Optional[logging.Handler] = None
+        self.listener: Optional[logging.handlers.QueueListener] = None
+
+
+_logs = _Logs()
+
+
+def _iniciar_listener() -> None:
+    fila: queue.SimpleQueue = queue.SimpleQueue()
+    _logs.manipulador_fila.queue = fila
+    _logs.listener = logging.handlers.QueueListener(fila, _logs.manipulador_arquivo, respect_handler_level=True)
+    _logs.listener.start()
+
+
+def _parar_listener() -> None:
+    if _logs.listener is not None:
+        _logs.listener.stop()
+        _logs.listener = None
+
+
+def configurar_logs(arquivo: str = LOG_ARQUIVO, nivel: str = LOG_NIVEL) -> None:
+    """Liga o logger raiz à fila; chamado uma vez por processo pelo load_files."""
+    if _logs.manipulador_fila is not None:
+        return
+    _logs.manipulador_arquivo = logging.FileHandler(arquivo, encoding="utf-8")
+    _logs.manipulador_arquivo.setFormatter(logging.Formatter(LOG_FORMATO, defaults={"contexto": ""}))
+    _logs.manipulador_fila = _ManipuladorFila(queue.SimpleQueue())
+    _logs.manipulador_fila.addFilter(FiltroContexto())
+
+    raiz = logging.getLogger()
+    for manipulador in raiz.handlers[:]:
+        raiz.removeHandler(manipulador)
+    raiz.addHandler(_logs.manipulador_fila)
+    raiz.setLevel(nivel)
+
+    _iniciar_listener()
+    atexit.register(_parar_listener)
+    # Workers do Celery nascem por fork e não herdam a thread do listener
+    os.register_at_fork(after_in_child=_iniciar_listener)
@@ -0,0 +1,50 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+_AUSENTE = object()
+
+
+class CacheLRU:
+    """Cache em memória com limite de itens e TTL opcional, seguro entre threads."""
+
+    def __init__(self, max_itens: int, ttl_segundos: Optional[float] = None):
+        self.max_itens = max(1, max_itens)
+        self.ttl_segundos = ttl_segundos
+        self._itens: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self.despejos = 0
+
+    def obter(self, chave: Hashable, padrao: Any = None) -> Any:
+        with self._lock:
+            item = self._itens.get(chave)
+            if item is None:
+                return padrao
+            valor, expira_em = item
+            if expira_em is not None and expira_em < time.monotonic():
+                del self._itens[chave]
+                return padrao
+            self._itens.move_to_end(chave)
+            return valor
+
+    def definir(self, chave: Hashable, valor: Any, ttl_segundos: Optional[float] = None) -> None:
+        ttl = ttl_segundos if ttl_segundos is not None else self.ttl_segundos
+        expira_em = time.monotonic() + ttl if ttl is not None else None
+        with self._lock:
+            self._itens[chave] = (valor, expira_em)
+            self._itens.move_to_end(chave)
+            while len(self._itens) > self.max_itens:
+                self._itens.popitem(last=False)
+                self.despejos += 1
+
+    def remover(self, chave: Hashable) -> None:
+        with self._lock:
+            self._itens.pop(chave, None)
+
+    def __contains__(self, chave: Hashable) -> bool:
+        return self.obter(chave, _AUSENTE) is not _AUSENTE
+
+    def __len__(self) -> int:
+        return len(self._itens)
+
@@ -0,0 +1,136 @@
+import re
+from dataclasses import dataclass
+
+from utils.correcao_ocr import normalizar_termo
+
+# Endereços sem cidade/UF são da área de entrega
+CIDADE_PADRAO = "Jardinópolis"
+ESTADO_PADRAO = "SP"
+
+# Abreviações expandidas na forma gravada no banco (minúsculas, com acento)
+TIPOS_LOGRADOURO = {
+    "R": "rua", "AV": "avenida", "AVN": "avenida", "AL": "alameda", "TV": "travessa",
+    "TRAV": "travessa", "PC": "praça", "PCA": "praça", "PRC": "praça", "ROD": "rodovia",
+    "EST": "estrada", "LGO": "largo", "LG": "largo", "VIA": "via",
+}
+TIPOS_BAIRRO = {
+    "JD": "jardim", "JARD": "jardim", "VL": "vila", "PQ": "parque", "PRQ": "parque",
+    "RES": "residencial", "CONJ": "conjunto", "CJ": "conjunto", "CH": "chácara", "NUC": "núcleo",
+}
+TITULOS = {
+    "DR": "doutor", "DRA": "doutora", "PROF": "professor", "PROFA": "professora", "STA": "santa",
+    "STO": "santo", "S": "são", "SR": "senhor", "CEL": "coronel", "CAP": "capitão", "GEN": "general",
+    "ENG": "engenheiro", "PE": "padre", "PRES": "presidente", "VER": "vereador", "MAL": "marechal",
+}
+# Fora da chave: "Rua Sete Setembro" e "Rua Sete de Setembro" são a mesma rua
+PREPOSICOES = {"DE", "DA", "DO", "DAS", "DOS", "E"}
+UFS = {
+    "AC", "AL", "AP", "AM", "BA", "CE", "DF", "ES", "GO", "MA", "MT", "MS", "MG", "PA", "PB",
+    "PR", "PE", "PI", "RJ", "RN", "RS", "RO", "RR", "SC", "SP", "SE", "TO",
+}
+SEM_NUMERO = "S/N"
+
+_PADRAO_CEP = re.compile(r"^(?:CEP\s*)?\d{5}-?\d{3}$")
+_PADRAO_CIDADE_UF = re.compile(r"^(.+?)\s*[-/]\s*([A-Za-z]{2})$")
+_PADRAO_NUMERO_FINAL = re.compile(r"^(.*\D)\s+(?:N[º°O.]?\s*)?(\d+)\s*$", re.IGNORECASE)
+_PADRAO_NUMERO = re.compile(r"\d+")
+_PADRAO_PONTUACAO = re.compile(r"[.;º°ª\"']")
+
+
+@dataclass(frozen=True)
+class EnderecoNormalizado:
+    rua: str
+    numero: str
+    bairro: str
+    cidade: str = CIDADE_PADRAO
+    estado: str = ESTADO_PADRAO
+
+    @property
+    def numero_banco(self) -> int:
+        """A tabela address guarda 0 para endereços sem número."""
+        return int(self.numero) if self.numero.isdigit() else 0
+
+    @property
+    def chave(self) -> str:
+        """Mesma chave para "R. Rui Barbosa, 118" e "RUA RUI BARBOSA,118, Jardinópolis, SP"."""
+        partes = (_chave_termo(self.rua), self.numero, _chave_termo(self.bairro),
+                  _chave_termo(self.cidade), self.estado.upper())
+        return "|".join(partes)
+
+    @property
+    def chave_rua(self) -> str:
+        """A rua na cidade, sem número nem bairro: ruas atravessam bairros."""
+        return "|".join((_chave_termo(self.rua), _chave_termo(self.cidade), self.estado.upper()))
+
+    def texto(self) -> str:
+        """Texto para o geocodificador."""
+        return ", ".join(p for p in (self.rua, self.numero, self.bairro, self.cidade, self.estado) if p)
+
+
+def _chave_termo(texto: str) -> str:
+    return " ".join(p for p in normalizar_termo(texto).split() if p not in PREPOSICOES)
+
+
+def _expandir(texto: str, tipos: dict) -> str:
+    """Minúsculas, sem pontuação, com o tipo (primeira palavra) e os títulos por extenso."""
+    palavras = []
+    for indice, palavra in enumerate(_PADRAO_PONTUACAO.sub(" ", texto).lower().split()):
+        termo = normalizar_termo(palavra)
+        if indice == 0 and termo in tipos:
+            palavra = tipos[termo]
+        elif termo in TITULOS and indice > 0:
+            palavra = TITULOS[termo]
+        palavras.append(palavra)
+    return " ".join(palavras)
+
+
+def _eh_cidade_padrao(parte: str) -> bool:
+    return normalizar_termo(parte) == normalizar_termo(CIDADE_PADRAO)
+
+
+def normalizar_endereco(endereco: str) -> EnderecoNormalizado:
+    """
+    Separa "rua, número, bairro[, cidade, UF]" tolerando abreviações, vírgulas
+    faltando, CEP e cidade/UF juntos ("Jardinópolis - SP").
+    """
+    partes = [p.strip() for p in endereco.split(",") if p.strip()]
+    partes = [p for p in partes if not _PADRAO_CEP.match(p.upper())]
+
+    cidade, estado = CIDADE_PADRAO, ESTADO_PADRAO
+    # Cidade e UF só no fim; a rua nunca é removida
+    while len(partes) > 1:
+        ultima = partes[-1]
+        cidade_uf = _PADRAO_CIDADE_UF.match(ultima)
+        if ultima.upper() in UFS and len(partes) > 2:
+            estado = ultima.upper()
+        elif cidade_uf and cidade_uf.group(2).upper() in UFS:
+            cidade, estado = cidade_uf.group(1), cidade_uf.group(2).upper()
+        elif _eh_cidade_padrao(ultima):
+            cidade = ultima
+        elif len(partes) > 3:
+            cidade = ultima
+        else:
+            break
+        partes.pop()
+
+    rua = partes[0] if partes else ""
+    numero = partes[1] if len(partes) > 1 else ""
+    bairro = partes[2] if len(partes) > 2 else ""
+    if not _PADRAO_NUMERO.search(numero) and normalizar_termo(numero).replace("/", "") != "SN":
+        # "Rua X 118, Centro": o número veio grudado na rua ("Rua 7" é o nome da rua)
+        grudado = _PADRAO_NUMERO_FINAL.match(rua)
+        if grudado and len(grudado.group(1).split()) > 1:
+            if numero and not bairro:
+                bairro = numero
+            rua, numero = grudado.group(1), grudado.group(2)
+    digitos = _PADRAO_NUMERO.search(numero)
+
+    if _eh_cidade_padrao(cidade):
+        cidade = CIDADE_PADRAO
+    return EnderecoNormalizado(
+        rua=_expandir(rua, TIPOS_LOGRADOURO),
+        numero=str(int(digitos.group())) if digitos and int(digitos.group()) else SEM_NUMERO,
+        bairro=_expandir(bairro, TIPOS_BAIRRO),
+        cidade=cidade,
+        estado=estado,
+    )
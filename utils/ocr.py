@@ -0,0 +1,339 @@
+import asyncio
+from contextlib import contextmanager
+import os
+from io import BytesIO
+import re
+from tempfile import TemporaryDirectory
+import time
+from typing import Dict, Iterator, List, Optional, Tuple, Union
+
+import fitz  # PyMuPDF
+import ocrmypdf
+from PIL import Image, ImageOps
+
+from load_files import logger
+from utils.ocr_motores import obter_motor
+from utils.ocr_preprocessamento import (
+    OCR_LARGURA_ALVO_PX,
+    OCR_PREPROCESSAMENTO,
+    PREPROCESSAMENTOS,
+    preprocessar_recibo,
+)
+
+# Texto nativo abaixo desse tamanho é tratado como PDF escaneado
+OCR_TEXTO_NATIVO_MIN_CHARS = int(os.getenv("OCR_TEXTO_NATIVO_MIN_CHARS", "80"))
+# Quantidade mínima de âncoras do cupom para aceitar o texto nativo
+OCR_TEXTO_NATIVO_MIN_ANCORAS = int(os.getenv("OCR_TEXTO_NATIVO_MIN_ANCORAS", "2"))
+
+# "texto": só o texto reconhecido (sidecar), sem gerar PDF de saída
+# "pdf": gera o PDF otimizado completo e extrai o texto dele
+# "direto": renderiza as páginas e reconhece com o motor do processo, sem OCRmyPDF
+MODOS_OCR = ("texto", "pdf", "direto")
+OCR_MODO_PADRAO = os.getenv("OCR_MODO_PADRAO", "texto")
+
+# Teto de resolução para renderizar páginas no fallback (o Tesseract rende bem a 300 dpi)
+OCR_DPI_MAXIMO = int(os.getenv("OCR_DPI_MAXIMO", "300"))
+# Memória máxima para a página renderizada em uma requisição
+OCR_MEMORIA_MAXIMA_MB = int(os.getenv("OCR_MEMORIA_MAXIMA_MB", "64"))
+
+# Fotos do tablet vão direto para o reconhecimento, sem embrulhar em PDF
+TIPOS_IMAGEM = ("image/jpeg", "image/png", "image/webp")
+
+# Modo "adaptativo": começa pelo nível mais barato e só escala quando o
+# parse_campos não encontra os campos obrigatórios
+MODO_ADAPTATIVO = "adaptativo"
+NIVEIS_OCR = (
+    {"nivel": "rapido", "modo": "direto", "dpi_maximo": int(os.getenv("OCR_DPI_RAPIDO", "200"))},
+    {"nivel": "padrao", "modo": "direto", "dpi_maximo": OCR_DPI_MAXIMO},
+    {"nivel": "completo", "modo": "texto", "dpi_maximo": OCR_DPI_MAXIMO},
+)
+
+# Caminho do arquivo no disco (uploads) ou o conteúdo em memória
+Documento = Union[str, bytes]
+
+ANCORAS_CUPOM = (
+    re.compile(r"CLIENTE:"),
+    re.compile(r"VALOR\s*DO\s*PEDIDO"),
+    re.compile(r"ENDEREÇO:"),
+    re.compile(r"TOTAL\s*ITENS:"),
+    re.compile(r"FORMA\s*DE\s*PAGAMENTO|PAGAMENTO\s*:"),
+    re.compile(r"\d{2}/\d{2}/\d{4}\s*ÀS"),
+)
+
+
+# Tempo acumulado por etapa enquanto um medir_etapas() estiver ativo (benchmarks)
+_tempos_etapas: Optional[Dict[str, float]] = None
+
+
+@contextmanager
+def medir_etapas() -> Iterator[Dict[str, float]]:
+    """Acumula o tempo de cada etapa do OCR feito neste processo dentro do bloco."""
+    global _tempos_etapas
+    anterior, _tempos_etapas = _tempos_etapas, {}
+    try:
+        yield _tempos_etapas
+    finally:
+        _tempos_etapas = anterior
+
+
+@contextmanager
+def _etapa(nome: str) -> Iterator[None]:
+    tempos = _tempos_etapas
+    if tempos is None:
+        yield
+        return
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        tempos[nome] = tempos.get(nome, 0.0) + time.perf_counter() - inicio
+
+
+def inicializar_trabalhador_ocr() -> None:
+    """Executado uma vez em cada processo do pool de OCR, antes do primeiro job."""
+    obter_motor()
+    logger.info("Processo de OCR %s pronto", os.getpid())
+
+
+def abrir_pdf(documento: Documento) -> fitz.Document:
+    """Abre pelo caminho quando possível, para o PyMuPDF ler direto do arquivo."""
+    if isinstance(documento, str):
+        return fitz.open(documento, filetype="pdf")
+    return fitz.open(stream=documento, filetype="pdf")
+
+
+def extrair_texto_nativo(documento: Documento) -> str:
+    """Lê a camada de texto embutida no PDF, sem OCR."""
+    with _etapa("texto_nativo"), abrir_pdf(documento) as doc:
+        return "\n".join(page.get_text("text") for page in doc)  # type: ignore
+
+
+def analisar_paginas_nativas(documento: Documento) -> Tuple[Optional[List[str]], int]:
+    """Retorna o texto nativo de cada página, quando o todo é suficiente, e o número de páginas."""
+    with abrir_pdf(documento) as doc:
+        textos = [page.get_text("text") for page in doc]  # type: ignore
+    return (textos if texto_nativo_suficiente("\n".join(textos)) else None), len(textos)
+
+
+def extrair_pagina_pdf(documento: Documento, indice: int) -> bytes:
+    """Copia uma única página para um PDF novo."""
+    with abrir_pdf(documento) as doc, fitz.open() as pagina:
+        pagina.insert_pdf(doc, from_page=indice, to_page=indice)
+        return pagina.tobytes()
+
+
+def texto_nativo_suficiente(texto: str) -> bool:
+    """
+    Pontua o texto embutido pelo driver da impressora.
+    Aceita quando tem tamanho mínimo e âncoras suficientes do cupom.
+    """
+    if len(texto.strip()) < OCR_TEXTO_NATIVO_MIN_CHARS:
+        return False
+    texto = texto.upper()
+    ancoras = sum(1 for padrao in ANCORAS_CUPOM if padrao.search(texto))
+    return ancoras >= OCR_TEXTO_NATIVO_MIN_ANCORAS
+
+
+def _ocr_somente_texto(entrada_path: str) -> str:
+    """
+    Roda o OCRmyPDF gerando apenas o sidecar de texto.
+    Sem PDF de saída não há otimização, pngquant nem passagem do Ghostscript.
+    """
+    with TemporaryDirectory() as temp_dir:
+        sidecar_path = os.path.join(temp_dir, "sidecar.txt")
+        # O OCRmyPDF renderiza, limpa e reconhece internamente; medido como uma etapa só
+        with _etapa("ocrmypdf"):
+            ocrmypdf.ocr(
+                entrada_path,
+                output_file=os.devnull,
+                output_type="none",
+                sidecar=sidecar_path,
+                language='por',
+                force_ocr=True,
+                rotate_pages=True,
+                deskew=True,
+                optimize=0,
+                skip_text=False,
+                clean=True,
+            )
+        with _etapa("extracao_texto"), open(sidecar_path, encoding="utf-8") as sidecar:
+            # O sidecar separa as páginas com form feed
+            return sidecar.read().replace("\f", "\n")
+
+
+def _ocr_pdf_completo(entrada_path: str) -> str:
+    with TemporaryDirectory() as temp_dir:
+        temp_output_path = os.path.join(temp_dir, "saida.pdf")
+
+        with _etapa("ocrmypdf"):
+            ocrmypdf.ocr(
+                entrada_path,
+                output_file=temp_output_path,
+                language='por',
+                force_ocr=True,
+                rotate_pages=True,
+                deskew=True,
+                optimize=3,
+                skip_text=False,
+                clean=True,
+                clean_final=True
+            )
+
+        texto_final = ""
+        with _etapa("extracao_texto"), fitz.open(temp_output_path) as doc:
+            for page in doc:
+                texto_final += page.get_text("text") # type: ignore
+        return texto_final
+
+
+def _dpi_dentro_do_orcamento(page, dpi_maximo: int, memoria_maxima_bytes: int) -> int:
+    # Em tons de cinza cada pixel ocupa 1 byte no pixmap e outro na imagem PIL
+    largura_pol = page.rect.width / 72
+    altura_pol = page.rect.height / 72
+    pixels_maximos = memoria_maxima_bytes / 2
+    dpi_orcamento = int((pixels_maximos / (largura_pol * altura_pol)) ** 0.5)
+    return max(72, min(dpi_maximo, dpi_orcamento))
+
+
+def renderizar_paginas(
+    documento: Documento,
+    dpi_maximo: int = OCR_DPI_MAXIMO,
+    memoria_maxima_mb: int = OCR_MEMORIA_MAXIMA_MB,
+) -> Iterator[Image.Image]:
+    """
+    Renderiza uma página por vez em tons de cinza.
+    A resolução de cada página é reduzida para caber no orçamento de memória.
+    """
+    memoria_maxima_bytes = memoria_maxima_mb * 1024 * 1024
+    with abrir_pdf(documento) as doc:
+        for page in doc:
+            dpi = _dpi_dentro_do_orcamento(page, dpi_maximo, memoria_maxima_bytes)
+            pixmap = page.get_pixmap(dpi=dpi, colorspace=fitz.csGRAY)  # type: ignore
+            imagem = Image.frombytes("L", (pixmap.width, pixmap.height), pixmap.samples)
+            del pixmap
+            yield imagem
+
+
+def _ocr_paginas_renderizadas(
+    documento: Documento,
+    preprocessamento: str = OCR_PREPROCESSAMENTO,
+    dpi_maximo: int = OCR_DPI_MAXIMO,
+) -> str:
+    motor = obter_motor()
+    textos = []
+    paginas = renderizar_paginas(documento, dpi_maximo=dpi_maximo)
+    while True:
+        with _etapa("rasterizacao"):
+            imagem = next(paginas, None)
+        if imagem is None:
+            break
+        if preprocessamento == "numpy":
+            with _etapa("preprocessamento"):
+                imagem = preprocessar_recibo(imagem)
+        with _etapa("reconhecimento"):
+            textos.append(motor.reconhecer(imagem))
+        # Libera a página antes de renderizar a próxima
+        imagem.close()
+        del imagem
+    return "\n".join(textos)
+
+
+def _ocr_com_ocrmypdf(entrada_path: str, modo: str) -> str:
+    if modo == "pdf":
+        return _ocr_pdf_completo(entrada_path)
+    return _ocr_somente_texto(entrada_path)
+
+
+def extrair_texto_ocr(
+    documento: Documento,
+    modo: str = OCR_MODO_PADRAO,
+    usar_texto_nativo: bool = True,
+    preprocessamento: str = OCR_PREPROCESSAMENTO,
+    dpi_maximo: int = OCR_DPI_MAXIMO,
+) -> str:
+    """
+    O pré-processamento e o dpi_maximo valem para as páginas renderizadas pelo
+    PyMuPDF (modo "direto" e fallback); o OCRmyPDF faz a própria limpeza com o unpaper.
+    """
+    try:
+        if modo not in MODOS_OCR:
+            raise ValueError(f"Modo de OCR inválido: {modo}")
+        if preprocessamento not in PREPROCESSAMENTOS:
+            raise ValueError(f"Pré-processamento inválido: {preprocessamento}")
+
+        # PDFs gerados pelo PDV já trazem texto; só escaneados precisam de OCR
+        if usar_texto_nativo:
+            try:
+                texto_nativo = extrair_texto_nativo(documento)
+            except Exception as e:
+                logger.warning("Falha ao ler texto nativo do PDF: %s", e)
+                texto_nativo = ""
+            if texto_nativo_suficiente(texto_nativo):
+                return texto_nativo
+
+        if modo == "direto":
+            return _ocr_paginas_renderizadas(documento, preprocessamento, dpi_maximo)
+
+        if isinstance(documento, str):
+            texto_final = _ocr_com_ocrmypdf(documento, modo)
+        else:
+            with TemporaryDirectory() as temp_dir:
+                temp_pdf_path = os.path.join(temp_dir, "entrada.pdf")
+                with open(temp_pdf_path, "wb") as temp_pdf:
+                    temp_pdf.write(documento)
+                texto_final = _ocr_com_ocrmypdf(temp_pdf_path, modo)
+
+        if not texto_final.strip():
+            logger.info("[Fallback OCR] Extraindo diretamente com o motor de OCR...")
+            texto_final = _ocr_paginas_renderizadas(documento, preprocessamento, dpi_maximo)
+
+        return texto_final
+
+    except Exception as e:
+        logger.error("Erro no OCR: %s", e)
+        raise
+
+
+def extrair_texto_imagem(documento: Documento, preprocessamento: str = OCR_PREPROCESSAMENTO) -> str:
+    """Reconhece uma foto do cupom, respeitando a orientação gravada no EXIF."""
+    if preprocessamento not in PREPROCESSAMENTOS:
+        raise ValueError(f"Pré-processamento inválido: {preprocessamento}")
+    with _etapa("decodificacao"), Image.open(documento if isinstance(documento, str) else BytesIO(documento)) as original:
+        # JPEG: decodifica já reduzido, sem passar da resolução que o OCR usa
+        original.draft("L", (OCR_LARGURA_ALVO_PX, OCR_LARGURA_ALVO_PX))
+        imagem = ImageOps.exif_transpose(original).convert("L")
+    if preprocessamento == "numpy":
+        with _etapa("preprocessamento"):
+            imagem = preprocessar_recibo(imagem)
+    with _etapa("reconhecimento"):
+        return obter_motor().reconhecer(imagem)
+
+
+def extrair_texto_pagina_ocr(documento: Documento, indice: int, **opcoes) -> str:
+    """Reconhece só a página `indice`; usado para distribuir as páginas entre processos."""
+    return extrair_texto_ocr(extrair_pagina_pdf(documento, indice), usar_texto_nativo=False, **opcoes)
+
+
+def extrair_paginas_ocr(documento: Documento, paginas: int, **opcoes) -> List[str]:
+    """Texto reconhecido de cada página, em ordem, no processo atual."""
+    if paginas <= 1:
+        return [extrair_texto_ocr(documento, usar_texto_nativo=False, **opcoes)]
+    return [extrair_texto_pagina_ocr(documento, indice, **opcoes) for indice in range(paginas)]
+
+
+async def extrair_paginas_ocr_paralelo(pool, documento: Documento, paginas: int, **opcoes) -> List[str]:
+    """Igual a extrair_paginas_ocr, com cada página em um processo do pool."""
+    if paginas <= 1:
+        return [await pool.executar(extrair_texto_ocr, documento, usar_texto_nativo=False, **opcoes)]
+
+    tarefas = [
+        asyncio.create_task(pool.executar(extrair_texto_pagina_ocr, documento, indice, **opcoes))
+        for indice in range(paginas)
+    ]
+    try:
+        return list(await asyncio.gather(*tarefas))
+    except BaseException:
+        # Uma página falhou: cancela as demais para liberar os processos
+        for tarefa in tarefas:
+            tarefa.cancel()
+        raise
@@ -0,0 +1,82 @@
+import os
+import threading
+from typing import List, Optional
+
+import pytesseract
+from PIL import Image
+
+from load_files import logger
+
+try:
+    import tesserocr
+except ImportError:  # pragma: no cover - depende da libtesseract instalada
+    tesserocr = None
+
+# "tesserocr": API do Tesseract carregada uma vez por processo
+# "pytesseract": um subprocesso do tesseract por página
+OCR_MOTOR = os.getenv("OCR_MOTOR", "tesserocr")
+OCR_IDIOMA = os.getenv("OCR_IDIOMA", "por")
+
+
+class MotorOCR:
+    nome = "base"
+
+    def reconhecer(self, imagem: Image.Image) -> str:
+        raise NotImplementedError
+
+
+class MotorPytesseract(MotorOCR):
+    nome = "pytesseract"
+
+    def __init__(self, idioma: str = OCR_IDIOMA):
+        self.config = f"--oem 3 --psm 6 -l {idioma}"
+
+    def reconhecer(self, imagem: Image.Image) -> str:
+        return pytesseract.image_to_string(imagem, config=self.config)
+
+
+class MotorTesserocr(MotorOCR):
+    """Mantém o modelo do idioma carregado entre páginas e requisições."""
+
+    nome = "tesserocr"
+
+    def __init__(self, idioma: str = OCR_IDIOMA):
+        if tesserocr is None:
+            raise RuntimeError("tesserocr não está instalado")
+        self._api = tesserocr.PyTessBaseAPI(
+            lang=idioma,
+            psm=tesserocr.PSM.SINGLE_BLOCK,
+            oem=tesserocr.OEM.DEFAULT,
+        )
+        # A API não é thread-safe
+        self._lock = threading.Lock()
+
+    def reconhecer(self, imagem: Image.Image) -> str:
+        with self._lock:
+            self._api.SetImage(imagem)
+            return self._api.GetUTF8Text()
+
+
+_motor: Optional[MotorOCR] = None
+
+
+def obter_motor() -> MotorOCR:
+    """Motor de OCR do processo atual, criado na primeira chamada."""
+    global _motor
+    if _motor is None:
+        if OCR_MOTOR == "tesserocr":
+            try:
+                _motor = MotorTesserocr()
+            except Exception as e:
+                logger.warning("tesserocr indisponível (%s); usando pytesseract", e)
+        if _motor is None:
+            _motor = MotorPytesseract()
+        logger.info("Motor de OCR: %s", _motor.nome)
+    return _motor
+
+
+def idiomas_disponiveis() -> List[str]:
+    if tesserocr is not None:
+        _, idiomas = tesserocr.get_languages()
+        return idiomas
+    return pytesseract.get_languages(config='')
@@ -0,0 +1,264 @@
+import asyncio
+import math
+import multiprocessing
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Iterator, Optional
+
+from load_files import logger
+
+# Processos dedicados ao OCR, separados do thread pool padrão do FastAPI
+OCR_WORKERS = int(os.getenv("OCR_WORKERS", str(os.cpu_count() or 1)))
+# Quantos jobs podem aguardar um processo livre antes de recusar novos uploads
+OCR_FILA_MAXIMA = int(os.getenv("OCR_FILA_MAXIMA", str(OCR_WORKERS * 2)))
+OCR_TIMEOUT_SEGUNDOS = float(os.getenv("OCR_TIMEOUT_SEGUNDOS", "60"))
+# Tempo para um processo novo subir e carregar o motor; não conta no timeout do job
+OCR_INICIALIZACAO_TIMEOUT_SEGUNDOS = float(os.getenv("OCR_INICIALIZACAO_TIMEOUT_SEGUNDOS", "120"))
+OCR_MP_CONTEXTO = os.getenv("OCR_MP_CONTEXTO", "spawn")
+
+_esperar_vaga: ContextVar[bool] = ContextVar("esperar_vaga_ocr", default=False)
+
+
+class FilaOCRCheia(Exception):
+    """A fila de admissão do OCR está cheia; o cliente deve tentar de novo depois."""
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"Fila de OCR cheia, tente novamente em {retry_after}s")
+        self.retry_after = retry_after
+
+
+class TempoOCREsgotado(Exception):
+    """O job passou do tempo limite e o processo que o executava foi encerrado."""
+
+
+@contextmanager
+def esperando_vaga() -> Iterator[None]:
+    """
+    Jobs disparados dentro do bloco (e nas tarefas criadas a partir dele) esperam
+    um processo livre em vez de serem recusados com FilaOCRCheia; usado pelo lote.
+    """
+    token = _esperar_vaga.set(True)
+    try:
+        yield
+    finally:
+        _esperar_vaga.reset(token)
+
+
+def _loop_trabalhador(conexao, inicializador: Optional[Callable[[], None]]) -> None:
+    if inicializador:
+        inicializador()
+    conexao.send(("pronto", None))
+    while True:
+        try:
+            tarefa = conexao.recv()
+        except (EOFError, OSError):
+            break
+        if tarefa is None:
+            break
+        func, args, kwargs = tarefa
+        try:
+            conexao.send(("ok", func(*args, **kwargs)))
+        except Exception as e:
+            try:
+                conexao.send(("erro", e))
+            except Exception:
+                # Exceção que não pode ser serializada
+                conexao.send(("erro", RuntimeError(repr(e))))
+
+
+class _Trabalhador:
+    def __init__(self, contexto, inicializador: Optional[Callable[[], None]]):
+        self.conexao, conexao_filho = contexto.Pipe()
+        self.processo = contexto.Process(
+            target=_loop_trabalhador,
+            args=(conexao_filho, inicializador),
+            daemon=True,
+        )
+        self.processo.start()
+        conexao_filho.close()
+        self.pronto = False
+
+    def encerrar(self, forcar: bool = False) -> None:
+        try:
+            if forcar:
+                self.processo.kill()
+            else:
+                self.conexao.send(None)
+            self.processo.join(timeout=5)
+            if self.processo.is_alive():
+                self.processo.kill()
+                self.processo.join(timeout=1)
+        except Exception as e:
+            logger.warning("Erro ao encerrar processo de OCR %s: %s", self.processo.pid, e)
+        finally:
+            self.conexao.close()
+
+
+class PoolOCR:
+    """
+    Pool de processos de OCR com fila de admissão limitada.
+
+    Cada job ocupa um processo inteiro; jobs que passam do tempo limite têm o
+    processo encerrado e substituído, então o trabalho é de fato cancelado.
+    """
+
+    def __init__(
+        self,
+        workers: int = OCR_WORKERS,
+        fila_maxima: int = OCR_FILA_MAXIMA,
+        timeout: float = OCR_TIMEOUT_SEGUNDOS,
+        inicializador: Optional[Callable[[], None]] = None,
+    ):
+        self.workers = max(1, workers)
+        self.fila_maxima = max(0, fila_maxima)
+        self.timeout = timeout
+        self._inicializador = inicializador
+        self._contexto = multiprocessing.get_context(OCR_MP_CONTEXTO)
+        self._livres: Optional[asyncio.Queue] = None
+        self._todos: set = set()
+
+        self._aguardando = 0
+        self._executando = 0
+        self._concluidos = 0
+        self._rejeitados = 0
+        self._timeouts = 0
+        self._espera_media = 0.0
+        self._espera_ultima = 0.0
+        self._execucao_media = 0.0
+
+    def _novo_trabalhador(self) -> _Trabalhador:
+        trabalhador = _Trabalhador(self._contexto, self._inicializador)
+        self._todos.add(trabalhador)
+        return trabalhador
+
+    def _descartar(self, trabalhador: _Trabalhador) -> None:
+        self._todos.discard(trabalhador)
+        trabalhador.encerrar(forcar=True)
+
+    def iniciar(self) -> None:
+        if self._livres is not None:
+            return
+        self._livres = asyncio.Queue()
+        for _ in range(self.workers):
+            self._livres.put_nowait(self._novo_trabalhador())
+        logger.info("Pool de OCR iniciado com %s processos", self.workers)
+
+    async def encerrar(self) -> None:
+        trabalhadores, self._todos = list(self._todos), set()
+        self._livres = None
+        await asyncio.gather(
+            *(asyncio.to_thread(t.encerrar) for t in trabalhadores),
+            return_exceptions=True,
+        )
+
+    def _estimar_retry_after(self) -> int:
+        execucao = self._execucao_media or self.timeout
+        return max(1, math.ceil(execucao * (self._aguardando / self.workers + 1)))
+
+    @staticmethod
+    def _media_movel(media: float, valor: float) -> float:
+        return valor if media == 0 else media * 0.8 + valor * 0.2
+
+    async def _aguardar_pronto(self, trabalhador: _Trabalhador) -> None:
+        """Espera o processo terminar o spawn e o inicializador antes do primeiro job."""
+        if trabalhador.pronto:
+            return
+        try:
+            await asyncio.wait_for(self._receber(trabalhador), timeout=OCR_INICIALIZACAO_TIMEOUT_SEGUNDOS)
+        except asyncio.TimeoutError:
+            raise RuntimeError(f"Processo de OCR não inicializou em {OCR_INICIALIZACAO_TIMEOUT_SEGUNDOS}s")
+        trabalhador.pronto = True
+
+    async def _enviar(self, trabalhador: _Trabalhador, func, args, kwargs) -> Any:
+        await asyncio.to_thread(trabalhador.conexao.send, (func, args, kwargs))
+        return await self._receber(trabalhador)
+
+    async def _receber(self, trabalhador: _Trabalhador) -> Any:
+        loop = asyncio.get_running_loop()
+        resposta = loop.create_future()
+        fd = trabalhador.conexao.fileno()
+
+        def _ler():
+            loop.remove_reader(fd)
+            if resposta.done():
+                return
+            try:
+                resposta.set_result(trabalhador.conexao.recv())
+            except Exception as e:
+                resposta.set_exception(e)
+
+        loop.add_reader(fd, _ler)
+        try:
+            return await resposta
+        finally:
+            loop.remove_reader(fd)
+
+    async def executar(self, func: Callable, *args, timeout: Optional[float] = None, **kwargs) -> Any:
+        """Executa func(*args, **kwargs) em um processo do pool."""
+        self.iniciar()
+        assert self._livres is not None
+
+        if not _esperar_vaga.get() and self._aguardando >= self.fila_maxima and self._livres.empty():
+            self._rejeitados += 1
+            raise FilaOCRCheia(self._estimar_retry_after())
+
+        inicio = time.monotonic()
+        self._aguardando += 1
+        try:
+            trabalhador = await self._livres.get()
+        finally:
+            self._aguardando -= 1
+        self._espera_ultima = time.monotonic() - inicio
+        self._espera_media = self._media_movel(self._espera_media, self._espera_ultima)
+
+        livres = self._livres
+        saudavel = True
+        self._executando += 1
+        try:
+            await self._aguardar_pronto(trabalhador)
+            inicio_execucao = time.monotonic()
+            status, valor = await asyncio.wait_for(
+                self._enviar(trabalhador, func, args, kwargs),
+                timeout=timeout or self.timeout,
+            )
+        except asyncio.TimeoutError:
+            saudavel = False
+            self._timeouts += 1
+            raise TempoOCREsgotado(f"OCR excedeu {timeout or self.timeout}s")
+        except (EOFError, OSError) as e:
+            saudavel = False
+            raise RuntimeError(f"Processo de OCR encerrado inesperadamente: {e}")
+        except BaseException:
+            # Requisição cancelada: o processo ainda está ocupado com o job
+            saudavel = False
+            raise
+        finally:
+            self._executando -= 1
+            if saudavel and trabalhador in self._todos:
+                livres.put_nowait(trabalhador)
+            else:
+                self._descartar(trabalhador)
+                if livres is self._livres:
+                    livres.put_nowait(self._novo_trabalhador())
+
+        self._concluidos += 1
+        self._execucao_media = self._media_movel(self._execucao_media, time.monotonic() - inicio_execucao)
+        if status == "erro":
+            raise valor
+        return valor
+
+    def estatisticas(self) -> dict:
+        return {
+            "workers": self.workers,
+            "fila_maxima": self.fila_maxima,
+            "aguardando": self._aguardando,
+            "executando": self._executando,
+            "concluidos": self._concluidos,
+            "rejeitados": self._rejeitados,
+            "timeouts": self._timeouts,
+            "espera_media_ms": round(self._espera_media * 1000, 1),
+            "espera_ultima_ms": round(self._espera_ultima * 1000, 1),
+            "execucao_media_ms": round(self._execucao_media * 1000, 1),
+        }
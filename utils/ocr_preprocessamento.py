@@ -0,0 +1,81 @@
+import os
+
+import numpy as np
+from PIL import Image
+
+# "numpy": recorta, reduz e binariza a página antes do reconhecimento
+# "nenhum": envia a página renderizada como está (para comparar tempo e acurácia)
+PREPROCESSAMENTOS = ("numpy", "nenhum")
+OCR_PREPROCESSAMENTO = os.getenv("OCR_PREPROCESSAMENTO", "numpy")
+
+# Largura útil da bobina térmica (~72 mm) a 300 dpi fica abaixo disso
+OCR_LARGURA_ALVO_PX = int(os.getenv("OCR_LARGURA_ALVO_PX", "1000"))
+OCR_LIMIAR_CONTEUDO = int(os.getenv("OCR_LIMIAR_CONTEUDO", "200"))
+OCR_JANELA_BINARIZACAO = int(os.getenv("OCR_JANELA_BINARIZACAO", "31"))
+# Pixels por faixa de linhas na binarização; limita os temporários a alguns MB
+OCR_BINARIZACAO_PIXELS_POR_FAIXA = 1 << 16
+
+
+def recortar_conteudo(cinza: np.ndarray, limiar: int = OCR_LIMIAR_CONTEUDO, margem: int = 10) -> np.ndarray:
+    """Recorta a faixa impressa do cupom, descartando as margens brancas."""
+    escuro = cinza < limiar
+    linhas = np.flatnonzero(escuro.any(axis=1))
+    colunas = np.flatnonzero(escuro.any(axis=0))
+    if linhas.size == 0 or colunas.size == 0:
+        return cinza
+    altura, largura = cinza.shape
+    return cinza[
+        max(0, linhas[0] - margem):min(altura, linhas[-1] + margem + 1),
+        max(0, colunas[0] - margem):min(largura, colunas[-1] + margem + 1),
+    ]
+
+
+def binarizar_adaptativo(cinza: np.ndarray, janela: int = OCR_JANELA_BINARIZACAO, sensibilidade: float = 0.15) -> np.ndarray:
+    """
+    Limiar adaptativo de Bradley: cada pixel é comparado à média da vizinhança,
+    calculada com imagem integral para custar O(pixels) qualquer que seja a janela.
+    A integral é uint32: mesmo dando a volta em páginas grandes, a diferença das
+    quatro quinas (a soma de uma janela) sai exata. Integral e somas são feitas em
+    faixas de linhas, então o pico fica em ~5 bytes por pixel (integral e saída).
+    """
+    altura, largura = cinza.shape
+    raio = janela // 2
+    banda = max(1, OCR_BINARIZACAO_PIXELS_POR_FAIXA // largura)
+    # Montada faixa a faixa: o cumsum direto na integral criaria uma cópia do tamanho da página
+    integral = np.zeros((altura + 1, largura + 1), dtype=np.uint32)
+    for inicio in range(0, altura, banda):
+        faixa = integral[inicio + 1:inicio + 1 + banda, 1:]
+        faixa[:] = np.cumsum(cinza[inicio:inicio + banda], axis=0, dtype=np.uint32)
+        np.cumsum(faixa, axis=1, out=faixa)
+        faixa += integral[inicio, 1:]
+
+    x0 = np.clip(np.arange(largura) - raio, 0, largura)
+    x1 = np.clip(np.arange(largura) + raio + 1, 0, largura)
+    largura_janela = (x1 - x0).astype(np.uint32)
+
+    saida = np.empty((altura, largura), dtype=np.uint8)
+    for inicio in range(0, altura, banda):
+        fim = min(altura, inicio + banda)
+        y0 = np.clip(np.arange(inicio, fim) - raio, 0, altura)
+        y1 = np.clip(np.arange(inicio, fim) + raio + 1, 0, altura)
+        baixo, cima = integral[y1], integral[y0]
+        soma = baixo[:, x1] - cima[:, x1] - baixo[:, x0] + cima[:, x0]
+        area = (y1 - y0).astype(np.uint32)[:, None] * largura_janela
+        texto = cinza[inicio:fim] * area < soma * (1.0 - sensibilidade)
+        saida[inicio:fim] = np.where(texto, 0, 255)
+    return saida
+
+
+def preprocessar_recibo(imagem: Image.Image, largura_alvo: int = OCR_LARGURA_ALVO_PX) -> Image.Image:
+    """Recorta a coluna impressa, reduz para a largura alvo e binariza."""
+    cinza = np.asarray(imagem.convert("L"))
+    recorte = Image.fromarray(recortar_conteudo(cinza))
+
+    if recorte.width > largura_alvo:
+        escala = largura_alvo / recorte.width
+        recorte = recorte.resize(
+            (largura_alvo, max(1, round(recorte.height * escala))),
+            Image.BOX,
+        )
+
+    return Image.fromarray(binarizar_adaptativo(np.asarray(recorte)))
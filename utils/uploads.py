@@ -0,0 +1,79 @@
+import hashlib
+import os
+import shutil
+import tempfile
+import zipfile
+from contextlib import asynccontextmanager, contextmanager
+from dataclasses import dataclass
+from typing import AsyncIterator, Iterator, List, Optional, Tuple
+
+from fastapi import HTTPException, UploadFile
+
+# Uploads são gravados em disco em blocos, sem carregar o arquivo inteiro na memória
+UPLOAD_TAMANHO_MAXIMO_MB = int(os.getenv("UPLOAD_TAMANHO_MAXIMO_MB", "20"))
+UPLOAD_DIR = os.getenv("UPLOAD_DIR") or None
+UPLOAD_BLOCO_BYTES = 1024 * 1024
+
+
+@dataclass
+class UploadSalvo:
+    caminho: str
+    tamanho: int
+    sha256: str
+
+
+def _limite_bytes(limite_mb: Optional[int]) -> int:
+    return (UPLOAD_TAMANHO_MAXIMO_MB if limite_mb is None else limite_mb) * 1024 * 1024
+
+
+@asynccontextmanager
+async def salvar_upload(
+    file: UploadFile, limite_mb: Optional[int] = None, sufixo: str = ""
+) -> AsyncIterator[UploadSalvo]:
+    """
+    Copia o upload para um arquivo temporário calculando o sha256 no caminho.
+    Recusa com 413 o que passar do limite; o arquivo é apagado ao sair do bloco.
+    """
+    limite = _limite_bytes(limite_mb)
+    fd, caminho = tempfile.mkstemp(prefix="upload_", suffix=sufixo, dir=UPLOAD_DIR)
+    try:
+        hash_conteudo = hashlib.sha256()
+        tamanho = 0
+        with os.fdopen(fd, "wb") as destino:
+            while bloco := await file.read(UPLOAD_BLOCO_BYTES):
+                tamanho += len(bloco)
+                if tamanho > limite:
+                    raise HTTPException(413, f"Arquivo maior que {limite // (1024 * 1024)} MB")
+                hash_conteudo.update(bloco)
+                destino.write(bloco)
+        yield UploadSalvo(caminho, tamanho, hash_conteudo.hexdigest())
+    finally:
+        try:
+            os.remove(caminho)
+        except FileNotFoundError:
+            pass
+
+
+@contextmanager
+def extrair_pdfs_zip(caminho_zip: str, limite_mb: Optional[int] = None) -> Iterator[List[Tuple[str, UploadSalvo]]]:
+    """Extrai os PDFs do zip para arquivos temporários, um por vez, com o mesmo limite do upload."""
+    limite = _limite_bytes(limite_mb)
+    diretorio = tempfile.mkdtemp(prefix="upload_zip_", dir=UPLOAD_DIR)
+    try:
+        pdfs = []
+        with zipfile.ZipFile(caminho_zip) as arquivo_zip:
+            for indice, info in enumerate(arquivo_zip.infolist()):
+                if info.is_dir() or not info.filename.lower().endswith(".pdf"):
+                    continue
+                if info.file_size > limite:
+                    raise HTTPException(413, f"{info.filename} maior que {limite // (1024 * 1024)} MB")
+                caminho = os.path.join(diretorio, f"{indice}.pdf")
+                hash_conteudo = hashlib.sha256()
+                with arquivo_zip.open(info) as origem, open(caminho, "wb") as destino:
+                    while bloco := origem.read(UPLOAD_BLOCO_BYTES):
+                        hash_conteudo.update(bloco)
+                        destino.write(bloco)
+                pdfs.append((info.filename, UploadSalvo(caminho, info.file_size, hash_conteudo.hexdigest())))
+        yield pdfs
+    finally:
+        shutil.rmtree(diretorio, ignore_errors=True)